@@ -0,0 +1,95 @@
+# bench_link_extract.py
+# Timing check for the router's link extraction: the compiled <a href> scanner
+# (iter_links, stops at the link cap) against the original BeautifulSoup tree walk
+# with urlparse per helper call. Runs over a directory of saved message bodies
+# (*.htm / *.html / *.txt), or synthetic marketing blasts when none is given.
+#   python bench_link_extract.py [--corpus Logs\bodies] [--cap 5]
+# Needs bs4 + lxml for the legacy side only.
+
+import os, glob, time, argparse
+from urllib.parse import urlparse, parse_qs, unquote
+from bs4 import BeautifulSoup
+from email_intake_graph_router import iter_links, MAX_LINKS_PER_MESSAGE
+
+def legacy_links(body_html, cap):
+    """handle_links' old extraction: full tree, then is_safelink/unwrap/host/path per anchor."""
+    out = []
+    for a in BeautifulSoup(body_html, "lxml").find_all("a", href=True):
+        if cap and len(out) >= cap:
+            break
+        raw = a["href"]
+        url = raw
+        if "safelinks.protection.outlook.com" in urlparse(raw).netloc.lower():
+            target = parse_qs(urlparse(raw).query).get("url", [None])[0]
+            url = unquote(target) if target else raw
+        h = urlparse(url).netloc.lower()
+        path = urlparse(url).path.lower()
+        kind = "pdf" if path.endswith(".pdf") else "zip" if path.endswith(".zip") else ""
+        out.append((url, h, kind))
+    return out
+
+def scanner_links(body_html, cap):
+    out = []
+    for rec in iter_links(body_html):
+        if cap and len(out) >= cap:
+            break
+        out.append((rec.url, rec.host, rec.kind))
+    return out
+
+def make_blast(kb, seed):
+    # Table-heavy newsletter: styles, tracking pixels and a few hundred SafeLinks-wrapped anchors
+    head = "<html><head><style>" + "td{font-family:Arial;padding:4px} " * 200 + "</style></head><body>"
+    row = ('<tr><td class="card"><img src="https://img.example.com/p{i}.png" width="600">'
+           '<p>Listing {i}: 24,500 SF neighborhood center, 96% leased, anchored by grocer.</p>'
+           '<a style="color:#0a5" href="https://nam10.safelinks.protection.outlook.com/?url='
+           'https%3A%2F%2Fclick.example-broker.com%2Fls%2F{s}{i}%3Futm_source%3Dblast&amp;data=05%7C01">View</a>'
+           ' <a href="https://www.example-broker.com/deals/{i}/om.pdf">OM</a></td></tr>')
+    parts, i = [head, "<table>"], 0
+    while sum(map(len, parts)) < kb * 1024:
+        parts.append(row.format(i=i, s=seed))
+        i += 1
+    parts.append("</table></body></html>")
+    return "".join(parts)
+
+def load_corpus(path):
+    bodies = []
+    for p in sorted(glob.glob(os.path.join(path, "*"))):
+        if p.lower().endswith((".htm", ".html", ".txt")):
+            with open(p, "r", encoding="utf-8", errors="replace") as f:
+                bodies.append((os.path.basename(p), f.read()))
+    return bodies
+
+def timed(fn, *a, reps=3):
+    best = None
+    for _ in range(reps):
+        t = time.perf_counter()
+        fn(*a)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return best * 1000
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", help="directory of saved message bodies")
+    ap.add_argument("--cap", type=int, default=MAX_LINKS_PER_MESSAGE, help="link cap (0 = every anchor)")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 250, 500], help="synthetic body sizes (KB)")
+    args = ap.parse_args()
+
+    bodies = load_corpus(args.corpus) if args.corpus else []
+    if not bodies:
+        bodies = [(f"blast_{kb}KB", make_blast(kb, n)) for n, kb in enumerate(args.sizes)]
+
+    print(f"{'body':<28} {'KB':>6} {'links':>6} {'bs4 ms':>9} {'scanner ms':>11} {'speedup':>8}")
+    tot_old = tot_new = 0.0
+    for name, body in bodies:
+        # Same links, same order, with and without the cap
+        assert scanner_links(body, 0) == legacy_links(body, 0), name
+        old = timed(legacy_links, body, args.cap)
+        new = timed(scanner_links, body, args.cap)
+        tot_old, tot_new = tot_old + old, tot_new + new
+        n = len(scanner_links(body, 0))
+        print(f"{name[:28]:<28} {len(body) / 1024:>6.0f} {n:>6} {old:>9.2f} {new:>11.3f} {old / max(new, 1e-6):>7.0f}x")
+    print(f"{'total':<28} {'':>6} {'':>6} {tot_old:>9.2f} {tot_new:>11.3f} {tot_old / max(tot_new, 1e-6):>7.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_ocr_frames.py
+# OCR calls per step for OcrEngine with and without frame diffing, replaying recorded
+# screen sequences (one directory of screenshots per step, in file-name order) or
+# synthetic ones. Each step runs until a target is found or the frames run out.
+# Needs Tesseract (TESSERACT_PATH) like the live clicker.
+#   python bench_ocr_frames.py [--frames Logs\ocr_rec\crexi_login Logs\ocr_rec\crexi_nda] [--targets "I Agree" Download]
+
+import os, glob, time, argparse
+from PIL import Image, ImageDraw, ImageFont
+from chrome_launcher_gui import OcrEngine
+
+DEFAULT_TARGETS = ["I Agree", "Accept", "Continue", "Download", "View OM", "Access Files"]
+
+def load_step(path):
+    files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith((".png", ".jpg", ".bmp")))
+    return [Image.open(f).convert("RGB") for f in files]
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def synthetic_steps(n=40):
+    """Page load (spinner ticking in one corner) then an NDA modal; and a page that never shows a target."""
+    W, H = 1600, 900
+    font = _font(22)
+    page = Image.new("RGB", (W, H), "white")
+    d = ImageDraw.Draw(page)
+    d.rectangle((0, 0, W, 70), fill=(30, 60, 110))
+    d.text((30, 20), "Broker Portal   Listings   Research   Account", fill="white", font=font)
+    for i in range(18):
+        d.text((60, 110 + i * 40), f"Listing {i + 1}: 24,500 SF neighborhood center, 96% leased, grocery anchored.",
+               fill=(40, 40, 40), font=font)
+    frames = []
+    for i in range(n):
+        f = page.copy()
+        ImageDraw.Draw(f).pieslice((W - 70, H - 70, W - 30, H - 30), i * 45 % 360, i * 45 % 360 + 270, fill=(120, 120, 120))
+        frames.append(f)
+    modal = frames[-1].copy()
+    d = ImageDraw.Draw(modal)
+    d.rectangle((500, 300, 1100, 600), fill="white", outline="black", width=3)
+    d.text((540, 340), "Confidentiality Agreement", fill="black", font=font)
+    d.rectangle((700, 500, 900, 560), fill=(215, 230, 245), outline="black")
+    d.text((745, 515), "I Agree", fill="black", font=font)
+    static = [page.copy() for _ in range(n)]
+    return [("nda_modal (synthetic)", frames[: n // 2] + [modal] * (n // 2)),
+            ("no_target (synthetic)", static)]
+
+def run(frames, targets, diff):
+    e = OcrEngine(frame_source=lambda: None, click=lambda x, y: None, diff=diff)
+    t = time.perf_counter()
+    hit = None
+    for img in frames:
+        hit = e.check(img, targets)
+        if hit:
+            break
+    return hit, e.stats, time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", nargs="+", help="one directory of screenshots per step")
+    ap.add_argument("--targets", nargs="+", default=DEFAULT_TARGETS)
+    args = ap.parse_args()
+
+    steps = [(os.path.basename(os.path.normpath(p)), load_step(p)) for p in args.frames] if args.frames else synthetic_steps()
+    print(f"{'step':<24} {'frames':>6} {'calls':>6} {'diff calls':>10} {'partial':>7} {'secs':>7} {'diff secs':>9} {'fewer':>6}")
+    tot = [0, 0]
+    for name, frames in steps:
+        hit0, s0, t0 = run(frames, args.targets, diff=False)
+        hit1, s1, t1 = run(frames, args.targets, diff=True)
+        if (hit0 is None) != (hit1 is None):
+            print(f"  !! {name}: full-frame OCR found {hit0}, diffed found {hit1}")
+        tot[0] += s0["ocr_calls"]
+        tot[1] += s1["ocr_calls"]
+        print(f"{name[:24]:<24} {len(frames):>6} {s0['ocr_calls']:>6} {s1['ocr_calls']:>10} {s1['partial']:>7} "
+              f"{t0:>7.2f} {t1:>9.2f} {s0['ocr_calls'] / max(1, s1['ocr_calls']):>5.1f}x")
+    print(f"{'total':<24} {'':>6} {tot[0]:>6} {tot[1]:>10} {'':>7} {'':>7} {'':>9} {tot[0] / max(1, tot[1]):>5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# bench_om_parsers.py
+# Timing check for the normalizer's text scanners (parse_prop_metrics / extract_mtm)
+# against the original per-label re.search and whole-document ".*?" MTM regex.
+# Synthetic documents of growing size; the new scanners should scale linearly.
+#   python bench_om_parsers.py [--pages 50 100 200 400]
+
+import re, time, argparse
+from om_normalizer_basic import parse_prop_metrics, extract_mtm
+
+class FakePages:
+    def __init__(self, text):
+        self.text = text
+
+def legacy_prop_metrics(text):
+    labels = ["total property gla", "total property occupancy", "shop sales psf", "occupancy cost",
+              "year built", "acreage", "parking", "placer.ai"]
+    out = []
+    text = text.lower()
+    for lab in labels:
+        m = re.search(rf"{re.escape(lab)}\s*[:=]?\s*([^\n;]+)", text, re.I)
+        if m: out.append(m.group(0))
+    return out
+
+def legacy_mtm(text):
+    text = text.replace("\n", " ")
+    m = re.search(r"\$?(\d+\.?\d*)\s*psf.*?\$?(\d+\.?\d*)\s*psf.*?(\d+\.?\d*)\s*%", text, re.I)
+    return m.groups() if m else None
+
+def make_doc(pages):
+    # Narrative pages with scattered "psf" mentions and no MTM headline: the worst case
+    # for the old ".*?" pattern, which rescans to the end of the text from every psf hit.
+    page = ("Market overview. Average asking rents of $24.50 psf in the submarket.\n" +
+            "The trade area benefits from strong traffic counts and new rooftops.\n" * 40)
+    body = [page for _ in range(pages)]
+    body.append("Total Property GLA: 212,000 SF\nTotal Property Occupancy: 94.1 percent\nYear Built: 2004\n")
+    return " ".join(body)
+
+def timed(fn, *a, reps=3):
+    best = None
+    for _ in range(reps):
+        t = time.perf_counter()
+        fn(*a)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return best * 1000
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, nargs="+", default=[4, 8, 16, 50, 100, 200, 400])
+    ap.add_argument("--legacy-max-pages", type=int, default=16,
+                    help="skip the legacy regexes above this size (they grow super-linearly)")
+    args = ap.parse_args()
+
+    print(f"{'pages':>6} {'chars':>10} {'legacy ms':>10} {'scanner ms':>11} {'scanner us/KB':>14}")
+    for n in args.pages:
+        text = make_doc(n)
+        pages = FakePages(text)
+        new = timed(lambda: (parse_prop_metrics(pages), extract_mtm(pages)))
+        old = "skipped"
+        if n <= args.legacy_max_pages:
+            assert parse_prop_metrics(pages) == legacy_prop_metrics(text)
+            assert not extract_mtm(pages) and legacy_mtm(text) is None
+            old = f"{timed(lambda: (legacy_prop_metrics(text), legacy_mtm(text)), reps=1):.1f}"
+        print(f"{n:>6} {len(text):>10,} {old:>10} {new:>11.2f} {new * 1000 / (len(text) / 1024):>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,71 @@
 # chrome_launcher_gui.py
 # Stable Chrome launcher + OCR clicker using system profile
 # (ported directly from the working FileCloud version)
+# OcrEngine: captures only OCR_ROI, downscales to OCR_MAX_WIDTH and binarizes before
+# Tesseract; OCR runs on a background thread overlapping the next capture and stops at
+# the first match; ocr_debug.png is written only when a search fails. Frame source and
+# click are injectable, so recorded screenshots can be fed through the same API headless.
+# pyautogui / ImageGrab are imported only when the live screen is used.
+# Frame diffing (OCR_DIFF): each frame is compared with the last OCR'd one on a small
+# thumbnail; unchanged frames skip OCR and a partial re-render (e.g. a modal) is OCR'd
+# only over the changed area plus a margin. While the screen is still changing from one
+# frame to the next (page rendering, spinners) OCR waits for it to settle, for at most
+# OCR_SETTLE_FRAMES frames.
+# Readiness: launch_chrome / clear_download_tray wait for the screen to stop changing
+# and for a download to show up in CHROME_DOWNLOAD_DIR instead of fixed sleeps; the
+# old sleep lengths remain as upper bounds. navigate() reuses the open window (ctrl+L)
+# for the next target instead of launching another one.
 
 import os
+import re
 import time
-import pyautogui
+import queue
+import threading
 import pytesseract
-from PIL import ImageGrab
+from PIL import Image, ImageOps, ImageChops
 from dotenv import load_dotenv
 import subprocess
 
 # ---------- Environment ----------
 load_dotenv()
-pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH")
+if os.getenv("TESSERACT_PATH"):
+    pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH")
+
+OCR_ROI = os.getenv("OCR_ROI", "")                       # "left,top,right,bottom" screen px; empty = full screen
+OCR_MAX_WIDTH = int(os.getenv("OCR_MAX_WIDTH", "1600"))   # wider captures are downscaled to this
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "1") == "1"
+OCR_DEBUG_PATH = "ocr_debug.png"
+OCR_DIFF = os.getenv("OCR_DIFF", "1") == "1"
+OCR_DIFF_THRESHOLD = int(os.getenv("OCR_DIFF_THRESHOLD", "12"))  # grey levels on the thumbnail
+OCR_PARTIAL_MAX = 0.6      # changed area above this share of the frame -> OCR the whole frame
+THUMB_WIDTH = 320
+THUMB_MARGIN = 6           # thumbnail px added around the changed area (~words cut at its edge)
+OCR_SETTLE_FRAMES = int(os.getenv("OCR_SETTLE_FRAMES", "4"))
+
+# Download waits (wait_for_download / clear_download_tray)
+CHROME_DOWNLOAD_DIR = os.getenv("CHROME_DOWNLOAD_DIR", os.path.join(os.path.expanduser("~"), "Downloads"))
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".partial", ".tmp")
+
+def _pyautogui():
+    import pyautogui
+    return pyautogui
 
 CHROME_PATH = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
 PROFILE_PATH = r"--profile-directory=Default"
 # Use the actual logged-in Chrome profile, not a temp one
 
 # ---------- Launch Chrome ----------
-def launch_chrome(target_url):
+def launch_chrome(target_url, max_wait=10):
     """
-    Launch Chrome using the system's default user profile (visible and authenticated)
+    Launch Chrome using the system's default user profile (visible and authenticated).
+    Returns once the window has appeared and the page stopped repainting (max_wait s at most).
     """
     if not os.path.exists(CHROME_PATH):
         raise FileNotFoundError(f"Chrome not found at {CHROME_PATH}")
 
+    grab = screen_frames(parse_roi(OCR_ROI))
+    baseline = _thumb(grab())
+    t0 = time.monotonic()
     subprocess.Popen([
         CHROME_PATH,
         "--new-window",
@@ -35,50 +75,323 @@ def launch_chrome(target_url):
         target_url
     ])
     print(f"Chrome launched -> {target_url}")
-    time.sleep(10)  # wait for visible rendering
+    ready = wait_for_screen_stable(max_wait, baseline=baseline, frame_source=grab)
+    print(f"Page {'ready' if ready else 'still changing'} after {time.monotonic() - t0:.1f}s")
+    return ready
+
+def navigate(target_url, max_wait=10):
+    """
+    Load target_url in the focused Chrome window (address bar via ctrl+L).
+    """
+    pyautogui = _pyautogui()
+    grab = screen_frames(parse_roi(OCR_ROI))
+    baseline = _thumb(grab())
+    t0 = time.monotonic()
+    pyautogui.hotkey("ctrl", "l")
+    pyautogui.write(target_url)
+    pyautogui.press("enter")
+    print(f"Navigated -> {target_url}")
+    ready = wait_for_screen_stable(max_wait, baseline=baseline, frame_source=grab)
+    print(f"Page {'ready' if ready else 'still changing'} after {time.monotonic() - t0:.1f}s")
+    return ready
 
 # ---------- OCR Click Engine ----------
-def ocr_find_and_click(target_words, max_wait=30, interval=2):
+def parse_roi(spec):
+    """'l,t,r,b' -> (l, t, r, b); empty -> None (full screen)."""
+    if not spec:
+        return None
+    l, t, r, b = (int(v) for v in spec.split(","))
+    return (l, t, r, b)
+
+def screen_frames(roi=None):
+    """Frame source for the live screen (ROI only)."""
+    from PIL import ImageGrab
+    return lambda: ImageGrab.grab(bbox=roi)
+
+def recorded_frames(paths):
+    """Frame source replaying screenshots in order, then holding the last one (headless runs)."""
+    frames = [Image.open(p) for p in paths]
+    it = iter(frames)
+    def grab():
+        try:
+            return next(it)
+        except StopIteration:
+            return frames[-1]
+    return grab
+
+def gui_click(x, y):
+    pg = _pyautogui()
+    pg.moveTo(x, y, duration=0.2)
+    pg.click()
+
+def _thumb(img):
+    return img.convert("L").resize((THUMB_WIDTH, max(1, round(img.height * THUMB_WIDTH / img.width))), Image.BOX)
+
+def _diff_bbox(a, b):
+    return ImageChops.difference(a, b).point(lambda p: 255 if p > OCR_DIFF_THRESHOLD else 0).getbbox()
+
+def _norm(w):
+    return re.sub(r"[^\w]", "", w.lower())
+
+class OcrEngine:
+    """
+    Find target words on screen (or in injected frames) and click them.
+    frame_source() returns a PIL image of the ROI; click(x, y) gets screen coordinates.
+    """
+    def __init__(self, roi=None, frame_source=None, click=None, max_width=OCR_MAX_WIDTH,
+                 binarize=OCR_BINARIZE, debug_path=OCR_DEBUG_PATH, diff=OCR_DIFF):
+        self.roi = roi if roi is not None else parse_roi(OCR_ROI)
+        self.frame_source = frame_source or screen_frames(self.roi)
+        self.click = click or gui_click
+        self.max_width = max_width
+        self.binarize = binarize
+        self.debug_path = debug_path
+        self.diff = diff
+        self.stats = {"frames": 0, "ocr_calls": 0, "skipped": 0, "settling": 0, "partial": 0, "ocr_secs": 0.0}
+        self.last = None    # last frame checked
+        self.last_ocr = None  # last image as Tesseract saw it (ROI crop, preprocessed; dumped on failure)
+        self.ref = None     # thumbnail of the last OCR'd frame
+        self.prev = None    # thumbnail of the previous frame checked
+        self.waited = 0     # frames deferred while the screen settles
+
+    def prepare(self, img):
+        """Grayscale, downscale past max_width, binarize. Returns (image, scale)."""
+        img = img.convert("L")
+        scale = 1.0
+        if self.max_width and img.width > self.max_width:
+            scale = self.max_width / img.width
+            img = img.resize((self.max_width, max(1, round(img.height * scale))), Image.BILINEAR)
+        if self.binarize:
+            img = ImageOps.autocontrast(img)
+            hist = img.histogram()
+            cut = sum(i * n for i, n in enumerate(hist)) // max(1, sum(hist))
+            img = img.point(lambda p: 255 if p > cut else 0)
+        return img, scale
+
+    def reset(self):
+        self.ref = self.prev = None
+        self.waited = 0
+
+    def changed_box(self, img):
+        """
+        Box of img to OCR: the whole frame, the changed area since the last OCR'd
+        frame, or None when nothing changed (or it is still changing).
+        """
+        full = (0, 0, img.width, img.height)
+        if not self.diff:
+            return full
+        thumb = _thumb(img)
+        ref, prev, box = self.ref, self.prev, full
+        self.prev = thumb
+        if ref is not None and ref.size == thumb.size:
+            changed = _diff_bbox(thumb, ref)
+            if changed is None:
+                self.stats["skipped"] += 1
+                return None
+            if prev is not None and prev.size == thumb.size and _diff_bbox(thumb, prev) and self.waited < OCR_SETTLE_FRAMES:
+                self.waited += 1
+                self.stats["settling"] += 1
+                return None
+            l, t, r, b = changed
+            k = img.width / THUMB_WIDTH
+            box = (max(0, int((l - THUMB_MARGIN) * k)), max(0, int((t - THUMB_MARGIN) * k)),
+                   min(img.width, int((r + THUMB_MARGIN) * k)), min(img.height, int((b + THUMB_MARGIN) * k)))
+            if (box[2] - box[0]) * (box[3] - box[1]) > OCR_PARTIAL_MAX * img.width * img.height:
+                box = full
+            else:
+                self.stats["partial"] += 1
+        self.ref = thumb
+        self.waited = 0
+        return box
+
+    def check(self, img, target_words):
+        """Diff one frame against the last OCR'd one and OCR what changed. Returns a hit or None."""
+        self.last = img
+        box = self.changed_box(img)
+        return self.locate(img, target_words, box) if box else None
+
+    def locate(self, img, target_words, box=None):
+        """
+        OCR one frame (or box of it). Returns (text, x, y) of the first match, centre in
+        screen coordinates, or None. Multi-word targets match consecutive words on a line.
+        """
+        bx, by = (box[0], box[1]) if box else (0, 0)
+        if box and box != (0, 0, img.width, img.height):
+            img = img.crop(box)
+        prepped, scale = self.prepare(img)
+        self.last_ocr = prepped
+        t0 = time.perf_counter()
+        data = pytesseract.image_to_data(prepped, output_type=pytesseract.Output.DICT)
+        self.stats["ocr_calls"] += 1
+        self.stats["ocr_secs"] += time.perf_counter() - t0
+        words = [_norm(w) for w in data["text"]]
+        lines = [(data["block_num"][i], data["par_num"][i], data["line_num"][i]) for i in range(len(words))]
+        targets = [[_norm(w) for w in tw.split()] for tw in target_words]
+        for i, word in enumerate(words):
+            if not word:
+                continue
+            for tw in targets:
+                n = len(tw)
+                if n == 1:
+                    if tw[0] not in word:
+                        continue
+                elif words[i:i + n] != tw or lines[i + n - 1] != lines[i]:
+                    continue
+                j = i + n - 1
+                left, top = data["left"][i], min(data["top"][i:j + 1])
+                right = data["left"][j] + data["width"][j]
+                bottom = max(data["top"][k] + data["height"][k] for k in range(i, j + 1))
+                ox, oy = (self.roi[0] + bx, self.roi[1] + by) if self.roi else (bx, by)
+                text = " ".join(data["text"][i:j + 1]).strip()
+                return text, ox + round((left + right) / 2 / scale), oy + round((top + bottom) / 2 / scale)
+        return None
+
+    def find(self, target_words, max_wait=30, poll=0):
+        """
+        Capture frames until a target is found or max_wait expires. OCR runs on a
+        background thread while the next frame is captured; poll = minimum seconds
+        between captures. Returns (text, x, y) or None.
+        """
+        frames = queue.Queue(maxsize=1)
+        done = threading.Event()
+        hit, err = [], []
+        self.last_ocr = None
+        self.reset()        # new targets: the first frame is always OCR'd in full
+
+        def ocr_loop():
+            while True:
+                img = frames.get()
+                if img is None:
+                    return
+                try:
+                    found = self.check(img, target_words)
+                except Exception as e:      # e.g. Tesseract missing: report it, not "not found"
+                    err.append(e)
+                    done.set()
+                    return
+                if found:
+                    hit.append(found)
+                    done.set()
+                    return
+
+        worker = threading.Thread(target=ocr_loop, daemon=True)
+        worker.start()
+        deadline = time.monotonic() + max_wait
+        try:
+            while not done.is_set() and time.monotonic() < deadline:
+                img = self.frame_source()
+                self.stats["frames"] += 1
+                while not done.is_set() and time.monotonic() < deadline:
+                    try:
+                        frames.put(img, timeout=0.05)
+                        break
+                    except queue.Full:
+                        pass
+                if poll:
+                    done.wait(poll)
+        finally:
+            # let the frame in flight finish (it may still match), then stop the worker
+            while worker.is_alive():
+                try:
+                    frames.put(None, timeout=0.05)
+                except queue.Full:
+                    pass
+                worker.join(0.05)
+        if err:
+            raise err[0]
+        if not hit and self.last is not None:
+            # What Tesseract was last given; if every frame was skipped, the last frame prepared the same way
+            seen = self.last_ocr if self.last_ocr is not None else self.prepare(self.last)[0]
+            seen.save(self.debug_path)
+            print(f"Saved {self.debug_path} (as Tesseract saw it) for review")
+        return hit[0] if hit else None
+
+    def find_and_click(self, target_words, max_wait=30, poll=0):
+        found = self.find(target_words, max_wait, poll)
+        if not found:
+            print(f"Target {target_words} not found after {max_wait}s.")
+            return False
+        text, x, y = found
+        self.click(x, y)
+        print(f"OCR clicked '{text}' at ({x},{y})")
+        return True
+
+_engine = None
+
+def ocr_find_and_click(target_words, max_wait=30, interval=0):
+    """
+    Scan visible screen for target words and click them (shared OcrEngine).
+    interval: minimum seconds between captures (0 = as fast as OCR allows).
+    """
+    global _engine
+    if _engine is None:
+        _engine = OcrEngine()
+    return _engine.find_and_click(target_words, max_wait, interval)
+
+# ---------- Readiness ----------
+def wait_for_screen_stable(max_wait=10, settle=1.0, poll=0.2, baseline=None, frame_source=None):
+    """
+    Wait until the screen (OCR_ROI) has not changed for `settle` s. With a baseline
+    thumbnail, it must first differ from it (e.g. the new window has appeared).
+    Returns True when stable, False at max_wait.
+    """
+    grab = frame_source or screen_frames(parse_roi(OCR_ROI))
+    end = time.monotonic() + max_wait
+    prev, stable_since = None, None
+    appeared = baseline is None
+    while True:
+        cur = _thumb(grab())
+        now = time.monotonic()
+        if not appeared:
+            appeared = cur.size != baseline.size or _diff_bbox(cur, baseline) is not None
+        if appeared and prev is not None and _diff_bbox(cur, prev) is None:
+            stable_since = stable_since or now
+            if now - stable_since >= settle:
+                return True
+        else:
+            stable_since = None
+        prev = cur
+        if now + poll > end:
+            return False
+        time.sleep(poll)
+
+def wait_for_download(since, max_wait=30, complete=True, download_dir=None, poll=0.2):
     """
-    Scan visible screen for target words and click them.
+    Wait for a file modified after `since` (time.time()) in the download directory.
+    complete=False also accepts an in-progress *.crdownload. Returns its path or None.
     """
-    waited = 0
-    clicked = False
-    while waited < max_wait and not clicked:
-        screenshot = ImageGrab.grab()
-        gray = screenshot.convert("L")
-        gray.save("ocr_debug.png")
-        print("Saved ocr_debug.png for review")
-
-        data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
-        for i, word in enumerate(data["text"]):
-            if any(tw.lower() in word.strip().lower() for tw in target_words):
-                x, y = data["left"][i], data["top"][i]
-                w, h = data["width"][i], data["height"][i]
-                pyautogui.moveTo(x + w // 2, y + h // 2, duration=0.2)
-                pyautogui.click()
-                print(f"OCR clicked '{word.strip()}' at ({x},{y})")
-                clicked = True
-                break
-
-        if not clicked:
-            time.sleep(interval)
-            waited += interval
-
-    if not clicked:
-        print(f"Target {target_words} not found after {max_wait}s.")
-    return clicked
+    folder = download_dir or CHROME_DOWNLOAD_DIR
+    end = time.monotonic() + max_wait
+    while True:
+        try:
+            with os.scandir(folder) as it:
+                for e in it:
+                    if not e.is_file() or e.stat().st_mtime < since:
+                        continue
+                    if not complete or not e.name.lower().endswith(PARTIAL_SUFFIXES):
+                        return e.path
+        except FileNotFoundError:
+            pass
+        if time.monotonic() + poll > end:
+            return None
+        time.sleep(poll)
 
 # ---------- Post-click Cleanup ----------
-def clear_download_tray():
+def clear_download_tray(since=None, max_wait=2):
     """
-    Dismiss Chrome's download bar and reposition cursor.
+    Dismiss Chrome's download bar and reposition cursor. Waits (up to max_wait s) for
+    a download started after `since` to show up, rather than a fixed delay.
+    Returns the download's path, or None if none appeared.
     """
-    time.sleep(2)
+    pyautogui = _pyautogui()
+    got = wait_for_download(since if since is not None else time.time(), max_wait, complete=False)
+    if got:
+        print(f"Download started: {os.path.basename(got)}")
     pyautogui.press('esc')
-    time.sleep(1)
+    wait_for_screen_stable(max_wait=1, settle=0.3, poll=0.1)
     pyautogui.moveRel(0, 750, duration=0.2)
     print("Mouse moved 750px down to clear download tray.")
+    return got
 
 # ---------- Example Test ----------
 if __name__ == "__main__":
@@ -1,4 +1,13 @@
-import os, json, argparse, shutil, yaml, pandas as pd
+import os, csv, glob, json, time, sqlite3, argparse, shutil, yaml, numpy as np, pandas as pd
+from datetime import datetime
+from file_lock import file_lock
+import om_rentroll
+
+# Labels journal: labels_log.csv is append-only (one locked line per label, never
+# rewritten). compact_labels() moves it into SQLite (labels_log.db, full history) and
+# starts a fresh journal; latest_labels() answers "current label per file" from both.
+LABEL_FIELDS = ["file", "norm_json", "label", "mtm_pct", "occupancy_pct", "reasons", "labeled_at"]
+LABELS_COMPACT_KB = int(os.getenv("LABELS_COMPACT_KB", "1024"))   # auto-compact past this journal size
 
 def to_pct(x):
     try:
@@ -34,83 +43,306 @@ def cleanup_previous(reviewroot, filename, keep_folder, missing_folder):
         except:
             pass
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--norm", required=True)                  # path to normalized JSON
-    ap.add_argument("--config", default=r"Config\guardrails.yaml")
-    ap.add_argument("--reviewroot", default=r"Outputs\Review")
-    ap.add_argument("--labels_csv", default=r"Outputs\labels_log.csv")
-    args = ap.parse_args()
+def link_or_copy(src, dst):
+    """Hardlink src to dst (no data copied); full copy across volumes or where links are unsupported."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "linked"
+    except OSError:
+        shutil.copy2(src, dst)
+        return "copied"
 
-    with open(args.norm, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    with open(args.config, "r", encoding="utf-8") as f:
-        G = yaml.safe_load(f) or {}
+def place_review(src_pdf, reviewroot, color, missing_folder):
+    """Put the PDF in reviewroot/color and remove it from the other label folders."""
+    filename = os.path.basename(src_pdf)
+    os.makedirs(os.path.join(reviewroot, color), exist_ok=True)
+    cleanup_previous(reviewroot, filename, color, missing_folder)
+    return link_or_copy(src_pdf, os.path.join(reviewroot, color, filename))
 
+def classify(df, G):
+    """Vectorized labeling. df has mtm_pct / occupancy_pct (NaN = missing);
+    adds label and reasons columns and returns df."""
     thr = G.get("simple_thresholds", {})
     mtm_g = float(thr.get("mtm_pct_green_min", 20))
     mtm_y = float(thr.get("mtm_pct_yellow_min", 10))
     occ_g = float(thr.get("occupancy_green_min", 92))
     occ_y = float(thr.get("occupancy_yellow_min", 88))
-
     missing_policy = (G.get("missing_policy") or "both").lower()           # "both" or "any"
-    missing_folder  = G.get("missing_folder_name") or "Missing Data"
-
-    # Extract metrics
-    mtm = meta.get("mtm_headline") or meta.get("mtm_head")
-    mtm_pct = to_pct(mtm.get("Avg_MTM_Pct")) if mtm else None
-
-    occ = None
-    if meta.get("property_metrics_csv"):
-        occ = parse_occ_from_pm(os.path.dirname(args.norm), meta["property_metrics_csv"])
 
-    has_mtm = mtm_pct is not None
-    has_occ = occ is not None
+    mtm, occ = df["mtm_pct"].astype(float), df["occupancy_pct"].astype(float)
+    has_mtm, has_occ = mtm.notna(), occ.notna()
 
     # Decide if this should be sent to Missing Data
     if missing_policy == "any":
-        is_missing = (not has_mtm) or (not has_occ)
+        is_missing = ~has_mtm | ~has_occ
     else:  # "both"
-        is_missing = (not has_mtm) and (not has_occ)
+        is_missing = ~has_mtm & ~has_occ
+    green  = (has_mtm & (mtm >= mtm_g)) | (has_occ & (occ >= occ_g))
+    yellow = ~green & ((has_mtm & (mtm >= mtm_y)) | (has_occ & (occ >= occ_y)))
+    df["label"] = np.select([is_missing, green, yellow], ["Missing Data", "Green", "Yellow"], "Red")
 
     reasons = []
-    if is_missing:
-        color = "Missing Data"
-        if not has_mtm: reasons.append("missing MTM%")
-        if not has_occ: reasons.append("missing Occupancy%")
-    else:
-        green  = (has_mtm and mtm_pct >= mtm_g) or (has_occ and occ >= occ_g)
-        yellow = (not green) and ((has_mtm and mtm_pct >= mtm_y) or (has_occ and occ >= occ_y))
-        color  = "Green" if green else ("Yellow" if yellow else "Red")
-        if has_mtm: reasons.append(f"MTM%={mtm_pct}")
-        if has_occ: reasons.append(f"Occ%={occ}")
+    for miss, m, o in zip(is_missing.tolist(), mtm.tolist(), occ.tolist()):
+        r = []
+        if miss:
+            if m != m: r.append("missing MTM%")
+            if o != o: r.append("missing Occupancy%")
+        else:
+            if m == m: r.append(f"MTM%={m}")
+            if o == o: r.append(f"Occ%={o}")
+        reasons.append("; ".join(r))
+    df["reasons"] = reasons
+    return df
 
-    # Ensure review folder exists and move/copy file
-    src_pdf = meta.get("source_pdf")
-    filename = os.path.basename(src_pdf) if src_pdf else ""
-    os.makedirs(os.path.join(args.reviewroot, color), exist_ok=True)
-    if src_pdf and os.path.exists(src_pdf):
-        cleanup_previous(args.reviewroot, filename, color, missing_folder)
-        shutil.copy2(src_pdf, os.path.join(args.reviewroot, color, filename))
+def load_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
 
-    # Log the label
-    row = {
-        "file": filename,
-        "norm_json": os.path.basename(args.norm),
-        "label": color,
+def metrics_row(meta, norm_path):
+    """Inputs to classify() for one normalized payload. The parsed rent roll wins over
+    the headline MTM and the property metrics CSV when it has a plausible figure."""
+    rr = om_rentroll.checked_metrics(meta.get("rentroll_metrics"))
+    mtm = meta.get("mtm_headline") or meta.get("mtm_head")
+    mtm_pct = rr.get("mtm_pct")
+    if mtm_pct is None and mtm:
+        mtm_pct = to_pct(mtm.get("Avg_MTM_Pct"))
+
+    occ = rr.get("occupancy_pct")
+    if occ is None and meta.get("property_metrics_csv"):
+        occ = parse_occ_from_pm(os.path.dirname(norm_path), meta["property_metrics_csv"])
+
+    src_pdf = meta.get("source_pdf")
+    return {
+        "file": os.path.basename(src_pdf) if src_pdf else "",
+        "norm_json": os.path.basename(norm_path),
+        "src_pdf": src_pdf,
         "mtm_pct": mtm_pct,
         "occupancy_pct": occ,
-        "reasons": "; ".join(reasons)
     }
-    os.makedirs(os.path.dirname(args.labels_csv), exist_ok=True)
-    if os.path.exists(args.labels_csv):
-        df = pd.read_csv(args.labels_csv)
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-        df.to_csv(args.labels_csv, index=False)
+
+def label(meta, norm_path, G, reviewroot=r"Outputs\Review", labels_csv=r"Outputs\labels_log.csv"):
+    """Label one normalized payload and copy its PDF into the review folder.
+    Appends to labels_csv unless it is None; returns the label row either way."""
+    missing_folder  = G.get("missing_folder_name") or "Missing Data"
+    row = metrics_row(meta, norm_path)
+    classify_one = classify(pd.DataFrame([row]), G)
+    color = str(classify_one.at[0, "label"])
+
+    # Ensure review folder exists and link/copy file
+    src_pdf = row.pop("src_pdf")
+    os.makedirs(os.path.join(reviewroot, color), exist_ok=True)
+    if src_pdf and os.path.exists(src_pdf):
+        place_review(src_pdf, reviewroot, color, missing_folder)
+
+    # Log the label
+    row.update(label=color, reasons=classify_one.at[0, "reasons"])
+    if labels_csv:
+        append_label(labels_csv, row)
+        print(f"Labeled {color} -> {labels_csv}")
     else:
-        pd.DataFrame([row]).to_csv(args.labels_csv, index=False)
+        print(f"Labeled {color}")
+    return row
+
+def labels_db_path(labels_csv):
+    return os.path.splitext(labels_csv)[0] + ".db"
+
+def _journal_header(labels_csv):
+    """Columns of an existing journal (first line only); None if missing/empty."""
+    try:
+        with open(labels_csv, "r", encoding="utf-8", newline="") as f:
+            return next(csv.reader(f), None)
+    except FileNotFoundError:
+        return None
+
+def append_label(labels_csv, row):
+    """Append one label line to the journal under a lock (safe with parallel labelers)."""
+    append_labels(labels_csv, [row])
 
-    print(f"Labeled {color} -> {args.labels_csv}")
+def append_labels(labels_csv, rows):
+    os.makedirs(os.path.dirname(labels_csv) or ".", exist_ok=True)
+    now = datetime.now().isoformat(timespec="seconds")
+    with file_lock(labels_csv + ".lock"):
+        header = _journal_header(labels_csv)
+        with open(labels_csv, "a", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=header or LABEL_FIELDS, extrasaction="ignore")
+            if not header:
+                w.writeheader()
+            w.writerows(dict(r, labeled_at=r.get("labeled_at") or now) for r in rows)
+        size = os.path.getsize(labels_csv)
+    if size > LABELS_COMPACT_KB * 1024:
+        compact_labels(labels_csv)
+
+def _open_labels_db(db_path):
+    db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS labels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file TEXT, norm_json TEXT, label TEXT, mtm_pct REAL, occupancy_pct REAL,
+            reasons TEXT, labeled_at TEXT);
+        CREATE INDEX IF NOT EXISTS labels_file ON labels (file, id);
+        CREATE TABLE IF NOT EXISTS batches (name TEXT PRIMARY KEY, rows INTEGER, compacted_at TEXT);
+    """)
+    return db
+
+def _num(v):
+    try:
+        return float(v) if v not in ("", None) else None
+    except ValueError:
+        return None
+
+def compact_labels(labels_csv, db_path=None):
+    """Move the journal into SQLite. The journal is renamed to a batch file under the lock
+    (appends continue into a fresh journal), imported once, then deleted. Returns rows moved."""
+    db_path = db_path or labels_db_path(labels_csv)
+    folder = os.path.dirname(labels_csv) or "."
+    stem = os.path.splitext(os.path.basename(labels_csv))[0]
+    with file_lock(labels_csv + ".lock"):
+        if os.path.exists(labels_csv):
+            os.replace(labels_csv, os.path.join(folder, f"{stem}.batch-{time.time_ns()}.csv"))
+    db = _open_labels_db(db_path)
+    moved = 0
+    try:
+        # Includes batches left behind by an interrupted compaction
+        for name in sorted(n for n in os.listdir(folder) if n.startswith(stem + ".batch-") and n.endswith(".csv")):
+            path = os.path.join(folder, name)
+            if not db.execute("SELECT 1 FROM batches WHERE name = ?", (name,)).fetchone():
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    rows = [(r.get("file"), r.get("norm_json"), r.get("label"), _num(r.get("mtm_pct")),
+                             _num(r.get("occupancy_pct")), r.get("reasons"), r.get("labeled_at") or "")
+                            for r in csv.DictReader(f)]
+                try:
+                    with db:
+                        db.execute("BEGIN IMMEDIATE")
+                        db.execute("INSERT INTO batches VALUES (?, ?, ?)",
+                                   (name, len(rows), datetime.now().isoformat(timespec="seconds")))
+                        db.executemany("INSERT INTO labels (file, norm_json, label, mtm_pct, occupancy_pct, reasons, labeled_at) "
+                                       "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                    moved += len(rows)
+                except sqlite3.IntegrityError:
+                    pass    # a concurrent compaction imported it first
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    finally:
+        db.close()
+    return moved
+
+def latest_labels(labels_csv, db_path=None):
+    """{file: row} with the most recent label per file, from the compacted history plus the journal."""
+    db_path = db_path or labels_db_path(labels_csv)
+    latest = {}
+    if os.path.exists(db_path):
+        db = _open_labels_db(db_path)
+        try:
+            q = (f"SELECT {', '.join(LABEL_FIELDS)} FROM labels "
+                 "WHERE id IN (SELECT MAX(id) FROM labels GROUP BY file)")
+            for r in db.execute(q):
+                latest[r[0]] = dict(zip(LABEL_FIELDS, r))
+        finally:
+            db.close()
+    try:
+        with open(labels_csv, "r", encoding="utf-8", newline="") as f:
+            for r in csv.DictReader(f):
+                latest[r.get("file")] = r
+    except FileNotFoundError:
+        pass
+    return latest
+
+def print_summary(labels_csv):
+    latest = latest_labels(labels_csv)
+    if not latest:
+        print(f"No labels found ({labels_csv})")
+        return
+    counts = {}
+    for r in latest.values():
+        counts[r["label"]] = counts.get(r["label"], 0) + 1
+    print(f"{'Label':<14} Count")
+    for name, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+        print(f"{name:<14} {n}")
+    print(f"{'Total':<14} {len(latest)}")
+
+def relabel_all(normdir, G, reviewroot=r"Outputs\Review", labels_csv=r"Outputs\labels_log.csv",
+                portfolio=r"Outputs\portfolio.db"):
+    """Relabel every normalized payload in one vectorized pass. Only files whose label
+    changed (or that are missing from their review folder) are moved, logged and
+    upserted into the portfolio table (by source PDF hash; None skips the table)."""
+    missing_folder = G.get("missing_folder_name") or "Missing Data"
+    rows = []
+    for path in glob.glob(os.path.join(normdir, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(meta, dict) and meta.get("source_pdf"):
+            rows.append(metrics_row(meta, path))
+    if not rows:
+        print(f"No normalized payloads in {normdir}")
+        return pd.DataFrame()
+
+    df = classify(pd.DataFrame(rows), G)
+    prev = latest_labels(labels_csv)
+    df["prev"] = [prev.get(f, {}).get("label") for f in df["file"]]
+    in_place = [os.path.exists(os.path.join(reviewroot, c, f)) for c, f in zip(df["label"], df["file"])]
+    todo = df[(df["label"] != df["prev"]) | ~pd.Series(in_place, index=df.index)]
+
+    placed = {"linked": 0, "copied": 0}
+    for src, color in zip(todo["src_pdf"], todo["label"]):
+        if os.path.exists(src):
+            placed[place_review(src, reviewroot, color, missing_folder)] += 1
+    changed = todo[todo["label"] != todo["prev"]]
+    if labels_csv and not changed.empty:
+        log = changed[LABEL_FIELDS[:-1]]
+        append_labels(labels_csv, log.astype(object).where(log.notna(), None).to_dict("records"))
+    if portfolio and not changed.empty:
+        from om_state import file_hash
+        from om_summary import open_portfolio, upsert_labels
+        rows = [dict(r, sha=file_hash(r["src_pdf"])) for r in changed.to_dict("records") if os.path.exists(r["src_pdf"])]
+        db = open_portfolio(portfolio)
+        try:
+            upsert_labels(db, rows)
+        finally:
+            db.close()
+
+    print(f"Relabeled {len(df)} payloads: {len(changed)} changed, {len(df) - len(todo)} untouched; "
+          f"review files linked={placed['linked']} copied={placed['copied']}")
+    for name, n in df["label"].value_counts().items():
+        print(f"  {name:<14} {n}")
+    return df
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--norm")                                 # path to normalized JSON
+    ap.add_argument("--config", default=r"Config\guardrails.yaml")
+    ap.add_argument("--reviewroot", default=r"Outputs\Review")
+    ap.add_argument("--labels_csv", default=r"Outputs\labels_log.csv")
+    ap.add_argument("--summary", action="store_true", help="count of latest label per file")
+    ap.add_argument("--compact", action="store_true", help="move the journal into labels_log.db")
+    ap.add_argument("--batch", action="store_true", help="relabel every payload in --normdir in one pass")
+    ap.add_argument("--normdir", default=r"Outputs\Normalized\OM_INTAKE")
+    ap.add_argument("--portfolio", default=r"Outputs\portfolio.db")
+    args = ap.parse_args()
+
+    if args.batch:
+        relabel_all(args.normdir, load_config(args.config), args.reviewroot, args.labels_csv, args.portfolio)
+        return
+
+    if args.compact:
+        print(f"Compacted {compact_labels(args.labels_csv)} label rows -> {labels_db_path(args.labels_csv)}")
+    if args.summary:
+        print_summary(args.labels_csv)
+    if args.compact or args.summary:
+        return
+    if not args.norm:
+        ap.error("--norm is required")
+
+    with open(args.norm, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    label(meta, args.norm, load_config(args.config), args.reviewroot, args.labels_csv)
 
 if __name__ == "__main__":
     main()
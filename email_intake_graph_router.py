@@ -4,16 +4,44 @@
 # - Skips known tracking/gated hosts early
 # - Unwraps SafeLinks
 # - Downloads direct PDFs/ZIPs to Inputs\
-# - Queues gated links to Logs\gated_queue.json
+# - Queues gated links in Logs\gated_queue.db (gated_queue; deduped on canonical URL,
+#   flushed once per message, exported to Logs\gated_queue.json at the end of the run)
 # - Writes progress to Logs\email_intake.log
+# - Optional bounded concurrency (--workers / INTAKE_WORKERS): messages and link
+#   probes run on thread pools with per-host limits; files and queue entries are
+#   committed in message order so results match a serial run
+# - Incremental sync: only messages newer than the cursor in Logs\intake_cursor.json,
+#   following @odata.nextLink so nothing past GRAPH_TOP is dropped (--full ignores it);
+#   it does not move past a message whose attachments failed (MESSAGE_RETRIES runs)
+# - One keep-alive session for all HTTP: per-host connection pools; Graph retries with
+#   exponential backoff and honors Retry-After on 429/503 (capped at RETRY_AFTER_MAX),
+#   broker hosts get one quick retry and never wait on Retry-After
+# - Downloads stream to disk in chunks (type sniffed from the first bytes) and
+#   ZIP members are streamed out one by one; MAX_DOWNLOAD_MB / MAX_ZIP_MEMBER_MB cap sizes
+# - Attachments: metadata listed first (no inline contentBytes), PDFs/ZIPs streamed
+#   from /$value; files already in Inputs or the om_state store are skipped by hash
+# - One MSAL app per process with its token cache persisted to Logs\msal_token_cache.bin
+#   (file-locked, shared across runs); tokens reused until near expiry, and a 401 from
+#   Graph triggers one re-auth + retry instead of failing the message
+# - Link verdicts (downloadable / gated / dead) cached in Logs\link_cache.json with
+#   TTLs (link_cache); known links skip the HEAD/GET, whole gated hosts are short-circuited
+# - Links pulled from the body by a compiled <a href> scanner (no parse tree) that stops
+#   at the link cap; each URL is parsed once into a LinkRec
 
-import os, re, io, json, zipfile, base64, logging
-from urllib.parse import urlparse, parse_qs, unquote
-from datetime import datetime
+import os, re, json, html, time, uuid, hashlib, zipfile, itertools, logging, argparse, threading, tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlparse, parse_qs, unquote, urlencode, quote
 import requests
-from bs4 import BeautifulSoup
-from msal import ConfidentialClientApplication
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from msal import ConfidentialClientApplication, SerializableTokenCache
 from dotenv import load_dotenv
+from om_state import StateStore
+from gated_queue import GatedQueue
+from link_cache import LinkCache, DOWNLOADABLE, GATED, DEAD
+from file_lock import file_lock
 
 ROOT   = os.getcwd()
 INPUTS = os.path.join(ROOT, "Inputs")
@@ -22,7 +50,8 @@ os.makedirs(INPUTS, exist_ok=True)
 os.makedirs(LOGS, exist_ok=True)
 
 LOG_PATH   = os.path.join(LOGS, "email_intake.log")
-QUEUE_PATH = os.path.join(LOGS, "gated_queue.json")
+CURSOR_PATH = os.path.join(LOGS, "intake_cursor.json")
+TOKEN_CACHE = os.path.join(LOGS, "msal_token_cache.bin")
 logging.basicConfig(filename=LOG_PATH, level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 # ---- Tunables ----
@@ -30,6 +59,18 @@ HEAD_TIMEOUT = 5
 GET_TIMEOUT  = 8
 MAX_LINKS_PER_MESSAGE = 5
 UA_HDRS = {"User-Agent": "Rainier-OM-Intake/1.0 (+Windows; Python requests)"}
+INTAKE_WORKERS    = int(os.getenv("INTAKE_WORKERS", "1"))     # 1 = serial
+HOST_CONCURRENCY  = int(os.getenv("HOST_CONCURRENCY", "2"))   # per broker host
+GRAPH_CONCURRENCY = int(os.getenv("GRAPH_CONCURRENCY", "4"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "4"))           # Graph
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "1.0"))        # 1s, 2s, 4s ... between retries
+RETRY_AFTER_MAX = float(os.getenv("RETRY_AFTER_MAX", "60"))   # cap on a Graph Retry-After sleep (s)
+BROKER_RETRIES = int(os.getenv("BROKER_RETRIES", "1"))        # broker HEAD/GET: one quick retry, no Retry-After
+MAX_DOWNLOAD_MB   = float(os.getenv("MAX_DOWNLOAD_MB", "500"))
+MAX_ZIP_MEMBER_MB = float(os.getenv("MAX_ZIP_MEMBER_MB", "200"))
+CHUNK = 1024 * 1024
+MESSAGE_RETRIES = int(os.getenv("MESSAGE_RETRIES", "3"))      # runs a message with failed attachments is retried
+TOKEN_MARGIN = 300        # refresh access tokens this many seconds before they expire
 
 # Known tracking/gated hosts to short-circuit
 GATED_TRACKING_HOSTS = {
@@ -50,25 +91,164 @@ CSECRET = os.getenv("GRAPH_CLIENT_SECRET", "")
 MAILBOX = os.getenv("GRAPH_USER", "")
 FOLDER  = os.getenv("GRAPH_FOLDER", "Inbox")
 TOP     = int(os.getenv("GRAPH_TOP", "50"))
+GRAPH_BASE = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0").rstrip("/")   # override for a mock server
+GRAPH_HOST = urlparse(GRAPH_BASE).netloc.lower()
 BROKER_LINK_DOMAINS = {
     d.strip().lower() for d in (os.getenv("BROKER_LINK_DOMAINS", "").split(",")) if d.strip()
 }
 
-def token() -> str:
-    app = ConfidentialClientApplication(
-        CID,
-        authority=f"https://login.microsoftonline.com/{TENANT}",
-        client_credential=CSECRET,
+# ---- Auth ----
+SCOPES = ["https://graph.microsoft.com/.default"]
+_msal_app = None
+_token_cache = SerializableTokenCache()
+_tok = {"access_token": None, "refresh_at": 0.0}
+_tok_lock = threading.Lock()
+
+def _load_token_cache():
+    try:
+        with open(TOKEN_CACHE, "r", encoding="utf-8") as f:
+            _token_cache.deserialize(f.read())
+    except (FileNotFoundError, ValueError):
+        pass
+
+def _save_token_cache():
+    if not _token_cache.has_state_changed:
+        return
+    tmp = TOKEN_CACHE + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(_token_cache.serialize())
+    os.replace(tmp, TOKEN_CACHE)
+    _token_cache.has_state_changed = False
+
+def token(stale=None) -> str:
+    """Graph access token, reused until TOKEN_MARGIN s before expiry. `stale` is a token
+    Graph just rejected: a new one is fetched unless another thread already replaced it."""
+    global _msal_app
+    with _tok_lock:
+        cur = _tok["access_token"]
+        if cur and cur != stale and time.time() < _tok["refresh_at"]:
+            return cur
+        # The file cache is shared with other runs: re-read it under the lock, so a token
+        # another process just fetched is reused instead of a new round-trip
+        with file_lock(TOKEN_CACHE + ".lock"):
+            _load_token_cache()
+            if _msal_app is None:
+                _msal_app = ConfidentialClientApplication(
+                    CID,
+                    authority=f"https://login.microsoftonline.com/{TENANT}",
+                    client_credential=CSECRET,
+                    token_cache=_token_cache,
+                )
+            # Checks the cache first; goes to the identity provider only when it has nothing usable
+            res = _msal_app.acquire_token_for_client(scopes=SCOPES)
+            if res.get("token_source") == "cache" and (res["access_token"] == stale or
+                                                       res.get("expires_in", 0) <= TOKEN_MARGIN):
+                _msal_app.remove_tokens_for_client()
+                res = _msal_app.acquire_token_for_client(scopes=SCOPES)
+            _save_token_cache()
+        if "access_token" not in res:
+            raise RuntimeError(f"MSAL auth failed: {res}")
+        ttl = int(res.get("expires_in", 3599))
+        _tok.update(access_token=res["access_token"], refresh_at=time.time() + ttl - min(TOKEN_MARGIN, ttl // 2))
+        logging.info(f"Token from {res.get('token_source', 'msal')}, expires in {ttl}s")
+        return res["access_token"]
+
+# ---- HTTP session ----
+class CappedRetry(Retry):
+    """Retry that honors Retry-After but never sleeps longer than RETRY_AFTER_MAX."""
+    def get_retry_after(self, response):
+        v = super().get_retry_after(response)
+        return None if v is None else min(v, RETRY_AFTER_MAX)
+
+def _retry():
+    """Graph: throttling is expected, so back off and honor (capped) Retry-After."""
+    return CappedRetry(
+        total=HTTP_RETRIES, connect=2, read=1, status=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,          # hand the final 429/5xx back so raise_for_status() reports it
+    )
+
+def _broker_retry():
+    """Broker sites: one short retry on connect errors / 502-504 so the 5s/8s probe
+    timeouts stay close to their face value; a link that still fails is queued."""
+    return Retry(
+        total=BROKER_RETRIES, connect=BROKER_RETRIES, read=0, status=BROKER_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
     )
-    scopes = ["https://graph.microsoft.com/.default"]
-    res = app.acquire_token_silent(scopes, account=None) or app.acquire_token_for_client(scopes=scopes)
-    if "access_token" not in res:
-        raise RuntimeError(f"MSAL auth failed: {res}")
-    return res["access_token"]
 
-def gget(url, tok, timeout=20):
+def make_session():
+    """Keep-alive session shared by every thread. Broker hosts get HOST_CONCURRENCY
+    pooled connections each; Graph gets its own adapter sized to GRAPH_CONCURRENCY."""
+    s = requests.Session()
+    s.headers.update(UA_HDRS)
+    web = HTTPAdapter(pool_connections=32, pool_maxsize=HOST_CONCURRENCY, max_retries=_broker_retry())
+    s.mount("https://", web)
+    s.mount("http://", web)
+    s.mount(GRAPH_BASE, HTTPAdapter(pool_connections=1, pool_maxsize=GRAPH_CONCURRENCY, max_retries=_retry()))
+    return s
+
+SESSION = make_session()
+
+# ---- Concurrency ----
+LINK_POOL = None          # set by main() when --workers > 1
+QUEUE = None              # GatedQueue, opened by main()
+LINKS = None              # LinkCache, opened by main()
+_host_sems = {}
+_host_lock = threading.Lock()
+
+@contextmanager
+def host_slot(h):
+    """Cap in-flight requests per host so broker sites (and Graph) don't throttle us."""
+    with _host_lock:
+        sem = _host_sems.get(h)
+        if sem is None:
+            sem = _host_sems[h] = threading.BoundedSemaphore(GRAPH_CONCURRENCY if h == GRAPH_HOST else HOST_CONCURRENCY)
+    with sem:
+        yield
+
+def submit_link(fn, *args):
+    if LINK_POOL is None:
+        f = Future()
+        f.set_result(fn(*args))
+        return f
+    return LINK_POOL.submit(fn, *args)
+
+class Capture:
+    """Files and gated links found in one message; committed in message order."""
+    def __init__(self):
+        self.files = []    # (final_path, staged_tmp_path, sha256)
+        self.queue = []    # gated URLs
+        self.errors = []   # transient failures (Graph / attachment download): message must be retried
+
+def graph_get(url, timeout, stream=False):
+    """GET against Graph with the current token; a 401 (expired/revoked) re-auths once and retries."""
+    tok = token()
+    r = SESSION.get(url, headers={"Authorization": f"Bearer {tok}"}, timeout=timeout, stream=stream)
+    if r.status_code == 401:
+        r.close()
+        logging.warning(f"401 from Graph, re-authenticating: {url}")
+        r = SESSION.get(url, headers={"Authorization": f"Bearer {token(stale=tok)}"}, timeout=timeout, stream=stream)
+    return r
+
+@contextmanager
+def gstream(url, timeout=GET_TIMEOUT):
+    """Streaming Graph GET (e.g. attachment /$value); yields the open response."""
+    with host_slot(GRAPH_HOST), graph_get(url, timeout, stream=True) as r:
+        r.raise_for_status()
+        yield r
+
+def gget(url, timeout=20):
     try:
-        r = requests.get(url, headers={"Authorization": f"Bearer {tok}", **UA_HDRS}, timeout=timeout)
+        with host_slot(GRAPH_HOST):
+            r = graph_get(url, timeout)
         r.raise_for_status()
         return r.json()
     except requests.Timeout:
@@ -86,186 +266,382 @@ def sanitize_filename(name: str) -> str:
     name = re.sub(r"[\\/:*?\"<>|]", "_", name).strip()
     return name or "file.pdf"
 
-def save_pdf_bytes(name_hint: str, data: bytes):
+class TooLarge(Exception):
+    pass
+
+def _pdf_target(name_hint: str):
     name = sanitize_filename(name_hint)
     if not name.lower().endswith(".pdf"):
         name += ".pdf"
     out = os.path.join(INPUTS, name)
-    with open(out, "wb") as f:
-        f.write(data)
-    logging.info(f"Saved PDF -> {out}")
-    print(f"  [+] saved: {out}")
+    return out, f"{out}.{uuid.uuid4().hex[:8]}.part"
+
+def read_chunks(fh):
+    return iter(lambda: fh.read(CHUNK), b"")
+
+def copy_capped(chunks, dst, limit_mb, hasher=None):
+    """Write an iterable of byte chunks to dst (hashing as it goes); raise TooLarge past limit_mb."""
+    limit, n = int(limit_mb * 1024 * 1024), 0
+    for chunk in chunks:
+        n += len(chunk)
+        if n > limit:
+            raise TooLarge(f"exceeds {limit_mb:g} MB")
+        if hasher:
+            hasher.update(chunk)
+        dst.write(chunk)
+    return n
+
+def download_to_temp(chunks, limit_mb=MAX_DOWNLOAD_MB):
+    """Spill a chunk stream to a *.part file in Inputs. Returns (path, sha256)."""
+    h = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=INPUTS, suffix=".part", delete=False) as f:
+        try:
+            copy_capped(chunks, f, limit_mb, h)
+        except Exception:
+            f.close()
+            os.remove(f.name)
+            raise
+    return f.name, h.hexdigest()
+
+def save_pdf_stream(name_hint: str, chunks, cap: Capture, limit_mb=MAX_DOWNLOAD_MB):
+    """Stage a PDF next to its final name (*.part is ignored by om_agent); commit() renames it."""
+    tmp, sha = download_to_temp(chunks, limit_mb)
+    save_pdf_file(name_hint, tmp, sha, cap)
+
+def save_pdf_file(name_hint: str, path: str, sha: str, cap: Capture):
+    """Stage an already downloaded temp file as a PDF (rename, no copy)."""
+    out, tmp = _pdf_target(name_hint)
+    os.replace(path, tmp)
+    cap.files.append((out, tmp, sha))
+
+# ---- Content dedup ----
+# Hashes of PDFs already in Inputs or recorded by om_agent's state store. Checked at
+# commit time (main thread, message order) so the surviving copy is deterministic.
+_known = None
+
+def known_hashes():
+    global _known
+    if _known is None:
+        store = StateStore()
+        try:
+            _known = store.processed_hashes()
+            for name in os.listdir(INPUTS):
+                if name.lower().endswith(".pdf"):
+                    _known.add(store.cached_hash(os.path.join(INPUTS, name)))
+        finally:
+            store.close()
+    return _known
 
-def extract_zip_to_inputs(zip_bytes: bytes):
+def commit(cap: Capture, subject: str):
+    known = known_hashes()
+    for out, tmp, sha in cap.files:
+        if sha in known:
+            os.remove(tmp)
+            logging.info(f"Duplicate content (skip): {os.path.basename(out)} sha256={sha[:12]}")
+            print(f"  [=] duplicate: {os.path.basename(out)}")
+            continue
+        os.replace(tmp, out)
+        known.add(sha)
+        logging.info(f"Saved PDF -> {out}")
+        print(f"  [+] saved: {out}")
+    for url in cap.queue:
+        QUEUE.add(url, subject)
     try:
-        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        new = QUEUE.flush()
+    except Exception as e:
+        logging.warning(f"Queue write failed: {e}")
+        return
+    for url in new:
+        print(f"  [>] queued gated: {url}")
+    if len(new) < len(cap.queue):
+        logging.info(f"Already queued (skip): {len(cap.queue) - len(new)} link(s)")
+
+def extract_zip_to_inputs(src, cap: Capture):
+    """src: path to a ZIP on disk; PDF members are streamed out one by one."""
+    try:
+        with zipfile.ZipFile(src) as zf:
             for memb in zf.infolist():
                 if memb.is_dir():
                     continue
                 if memb.filename.lower().endswith(".pdf"):
-                    save_pdf_bytes(os.path.basename(memb.filename), zf.read(memb))
+                    if memb.file_size > MAX_ZIP_MEMBER_MB * 1024 * 1024:
+                        logging.warning(f"ZIP member too large (skip): {memb.filename} {memb.file_size} bytes")
+                        continue
+                    with zf.open(memb) as fh:
+                        save_pdf_stream(os.path.basename(memb.filename), read_chunks(fh), cap, MAX_ZIP_MEMBER_MB)
     except zipfile.BadZipFile:
         logging.warning("Invalid ZIP file provided")
     except Exception as e:
         logging.warning(f"Failed to extract ZIP: {e}")
 
-def is_safelink(url: str) -> bool:
-    try:
-        return "safelinks.protection.outlook.com" in urlparse(url).netloc.lower()
-    except Exception:
-        return False
+# ---- Link extraction ----
+# <a ...href=...> start tags in document order; comments, <script> and <style> are
+# matched first so anchors inside them are skipped (as an HTML parser would).
+A_HREF_RE = re.compile(
+    r"""<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>"""
+    r"""|<a\s(?:[^>"']|"[^"]*"|'[^']*')*?(?<![\w-])href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""",
+    re.I | re.S)
 
-def unwrap_safelink(url: str) -> str:
-    try:
-        p = urlparse(url)
-        q = parse_qs(p.query)
-        target = q.get("url", [None])[0]
-        if target:
-            return unquote(target)
-    except Exception:
-        pass
-    return url
+# raw href, unwrapped url, lowercased host, path, "pdf"/"zip"/""
+LinkRec = namedtuple("LinkRec", "raw url host path kind")
 
-def host(url: str) -> str:
+def link_record(raw: str) -> LinkRec:
+    """Parse a href once: unwrap SafeLinks and pull out what handle_links/download_link need."""
+    url = raw
     try:
-        return urlparse(url).netloc.lower()
-    except Exception:
-        return ""
+        p = urlparse(raw)
+        if "safelinks.protection.outlook.com" in p.netloc.lower():
+            target = parse_qs(p.query).get("url", [None])[0]
+            if target:
+                url = unquote(target)
+                p = urlparse(url)
+        path = p.path
+        low = path.lower()
+        kind = "pdf" if low.endswith(".pdf") else "zip" if low.endswith(".zip") else ""
+        return LinkRec(raw, url, p.netloc.lower(), path, kind)
+    except ValueError:
+        return LinkRec(raw, url, "", "", "")
 
-def likely_file_endpoint(url: str) -> str:
-    try:
-        p = urlparse(url)
-        path = p.path.lower()
-        if path.endswith(".pdf"):
-            return "pdf"
-        if path.endswith(".zip"):
-            return "zip"
-        return ""
-    except Exception:
-        return ""
-
-def direct_downloadable(url: str) -> bool:
-    try:
-        h = host(url)
-        if h in GATED_TRACKING_HOSTS:
-            return False
-        if not any(h.endswith(d) for d in BROKER_LINK_DOMAINS):
-            return False
-        r = requests.head(url, headers=UA_HDRS, timeout=HEAD_TIMEOUT, allow_redirects=True)
-        ct = (r.headers.get("content-type", "").lower())
-        return (
-            r.status_code == 200 and
-            (ct.startswith("application/pdf") or ct.startswith("application/zip") or
-             url.lower().endswith(".pdf") or url.lower().endswith(".zip"))
-        )
-    except Exception:
-        return False
-
-def write_queue_append(url: str, subject: str):
+def iter_links(body_html: str):
+    """Yield a LinkRec per anchor href, lazily: the scan stops when the caller stops."""
+    for m in A_HREF_RE.finditer(body_html):
+        href = m.group(1) if m.group(1) is not None else m.group(2) if m.group(2) is not None else m.group(3)
+        if href is not None:
+            yield link_record(html.unescape(href).strip())
+
+def remember(url: str, verdict: str, host=True):
+    """host=False keeps the verdict off the host tally (403s are often bot filters, not logins)."""
+    if LINKS is not None:
+        LINKS.put(url, verdict, host)
+
+def probe_link(rec: LinkRec):
+    """HEAD an allowlisted link -> (downloadable / gated / dead, status code); verdict None
+    when the server does not answer HEAD (405/501) and only the GET can tell."""
     try:
-        q = {"queue": []}
-        if os.path.exists(QUEUE_PATH):
-            with open(QUEUE_PATH, "r", encoding="utf-8") as f:
-                cur = json.load(f)
-                if isinstance(cur, dict) and isinstance(cur.get("queue"), list):
-                    q = cur
-        q["queue"].append({
-            "url": url,
-            "subject": subject[:200],
-            "queued_at": datetime.utcnow().isoformat() + "Z"
-        })
-        tmp = QUEUE_PATH + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(q, f, indent=2)
-        os.replace(tmp, QUEUE_PATH)
-        print(f"  [>] queued gated: {url}")
-    except Exception as e:
-        logging.warning(f"Queue write failed: {e}")
+        with host_slot(rec.host):
+            r = SESSION.head(rec.url, timeout=HEAD_TIMEOUT, allow_redirects=True)
+    except requests.RequestException:
+        return DEAD, 0
+    if r.status_code in (405, 501):
+        return None, r.status_code
+    if r.status_code in (404, 410) or r.status_code >= 500:
+        return DEAD, r.status_code
+    ct = (r.headers.get("content-type", "").lower())
+    if r.status_code == 200 and (
+            ct.startswith("application/pdf") or ct.startswith("application/zip") or
+            rec.url.lower().endswith((".pdf", ".zip"))):
+        return DOWNLOADABLE, 200
+    return GATED, r.status_code
 
-def download_link(url: str) -> int:
-    kind = likely_file_endpoint(url)
-    if not kind and not direct_downloadable(url):
-        return 0
+def download_link(rec: LinkRec, cap: Capture, verdict=None) -> int:
+    """verdict: cached classification; DOWNLOADABLE skips the HEAD probe."""
+    url, kind = rec.url, rec.kind
+    if not kind and verdict != DOWNLOADABLE:
+        verdict, code = probe_link(rec)
+        if verdict not in (DOWNLOADABLE, None):
+            remember(url, verdict, host=code != 403)
+            return 0
+    tmp = None
     try:
-        r = requests.get(url, allow_redirects=True, timeout=GET_TIMEOUT, headers=UA_HDRS)
-        r.raise_for_status()
-        ct = (r.headers.get("content-type", "").lower())
-        if kind == "pdf" or ct.startswith("application/pdf") or r.content[:5] == b"%PDF-":
-            fname = os.path.basename(urlparse(url).path) or "download.pdf"
-            save_pdf_bytes(fname, r.content)
-            return 1
-        if kind == "zip" or "zip" in ct:
-            extract_zip_to_inputs(r.content)
-            return 1
+        with host_slot(rec.host), SESSION.get(url, allow_redirects=True, timeout=GET_TIMEOUT, stream=True) as r:
+            r.raise_for_status()
+            ct = (r.headers.get("content-type", "").lower())
+            if int(r.headers.get("content-length") or 0) > MAX_DOWNLOAD_MB * 1024 * 1024:
+                raise TooLarge(f"content-length {r.headers['content-length']} exceeds {MAX_DOWNLOAD_MB:g} MB")
+            # Sniff the type from the first chunk; anything else (e.g. an HTML login page) stops here
+            chunks = r.iter_content(CHUNK)
+            first = next(chunks, b"")
+            if kind == "pdf" or ct.startswith("application/pdf") or first.startswith(b"%PDF-"):
+                kind = "pdf"
+            elif kind == "zip" or "zip" in ct or first.startswith(b"PK\x03\x04"):
+                kind = "zip"
+            else:
+                remember(url, GATED)
+                return 0
+            tmp, sha = download_to_temp(itertools.chain([first], chunks))
+        if kind == "pdf":
+            fname = os.path.basename(rec.path) or "download.pdf"
+            save_pdf_file(fname, tmp, sha, cap)
+            tmp = None
+        else:
+            extract_zip_to_inputs(tmp, cap)
+        remember(url, DOWNLOADABLE)
+        return 1
+    except TooLarge as e:
+        logging.warning(f"Download too large (abort) {url}: {e}")
     except requests.Timeout:
         logging.warning(f"Timeout downloading {url}")
+        remember(url, DEAD)
     except requests.HTTPError as e:
         logging.warning(f"HTTP error downloading {url}: {e}")
+        code = e.response.status_code if e.response is not None else 0
+        remember(url, GATED if code in (401, 403) else DEAD, host=code != 403)
+    except requests.ConnectionError as e:
+        logging.warning(f"Connection failed downloading {url}: {e}")
+        remember(url, DEAD)
     except zipfile.BadZipFile:
         logging.warning(f"Invalid ZIP file at {url}")
     except Exception as e:
         logging.warning(f"Unexpected error downloading {url}: {e}")
+    finally:
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
     return 0
 
-def handle_attachments(mid: str, tok: str) -> int:
+# ---- Incremental sync ----
+# Cursor = newest receivedDateTime already committed plus the message ids seen at
+# exactly that timestamp (the `ge` filter returns them again).
+MSG_SELECT = "id,subject,from,hasAttachments,body,receivedDateTime"
+
+def load_cursor():
+    """Saved cursor, or None. "received" is None when only retry counts have been saved
+    (a held message before the first commit): the sync is still a first run."""
+    try:
+        with open(CURSOR_PATH, "r", encoding="utf-8") as f:
+            cur = json.load(f)
+        if isinstance(cur, dict) and "received" in cur:
+            return cur
+    except (FileNotFoundError, ValueError):
+        pass
+    return None
+
+def save_cursor(cur):
+    tmp = CURSOR_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cur, f, indent=2)
+    os.replace(tmp, CURSOR_PATH)
+
+def advance_cursor(cur, m):
+    ts, mid = m.get("receivedDateTime"), m.get("id")
+    if not ts:
+        return cur
+    if cur is None or ts > cur["received"]:
+        return {"received": ts, "ids": [mid]}
+    if ts == cur["received"] and mid not in cur["ids"]:
+        cur["ids"].append(mid)
+    return cur
+
+def iter_pages(url):
+    """Yield items across every page, following @odata.nextLink."""
+    while url:
+        data = gget(url)
+        yield from data.get("value", [])
+        url = data.get("@odata.nextLink")
+
+def fetch_messages(cursor, full=False):
+    base = f"{GRAPH_BASE}/users/{MAILBOX}/mailFolders/{FOLDER}/messages"
+    if full or cursor is None:
+        # First run / --full: newest TOP messages, as before
+        params = {"$top": TOP, "$orderby": "receivedDateTime desc", "$select": MSG_SELECT}
+        data = gget(base + "?" + urlencode(params, quote_via=quote, safe="$,"))
+        return data.get("value", [])[::-1]
+    params = {"$filter": f"receivedDateTime ge {cursor['received']}", "$orderby": "receivedDateTime asc",
+              "$top": TOP, "$select": MSG_SELECT}
+    seen = set(cursor.get("ids", []))
+    return [m for m in iter_pages(base + "?" + urlencode(params, quote_via=quote, safe="$,:"))
+            if m.get("id") not in seen]
+
+def handle_attachments(mid: str, cap: Capture) -> int:
     saved = 0
     try:
-        base = f"https://graph.microsoft.com/v1.0/users/{MAILBOX}/messages/{mid}/attachments"
-        atts = gget(base, tok)
-        for att in atts.get("value", []):
+        base = f"{GRAPH_BASE}/users/{MAILBOX}/messages/{mid}/attachments"
+        # Metadata only; content is streamed per attachment below
+        for att in iter_pages(f"{base}?$select=id,name,contentType,size"):
             ct = (att.get("contentType") or "").lower()
             name = att.get("name", "").lower()
             if not (ct.startswith("application/pdf") or name.endswith(".pdf") or
                     ct.startswith("application/zip") or name.endswith(".zip")):
                 continue
-            data = base64.b64decode(att.get("contentBytes", ""))
-            if name.endswith(".pdf"):
-                save_pdf_bytes(name, data)
-                saved += 1
-            elif name.endswith(".zip"):
-                extract_zip_to_inputs(data)
-                saved += 1
+            if (att.get("size") or 0) > MAX_DOWNLOAD_MB * 1024 * 1024:
+                logging.warning(f"Attachment too large (skip): {name} {att.get('size')} bytes")
+                continue
+            with gstream(f"{base}/{att['id']}/$value") as r:
+                tmp, sha = download_to_temp(r.iter_content(CHUNK))
+            try:
+                if name.endswith(".pdf"):
+                    save_pdf_file(name, tmp, sha, cap)
+                    tmp = None
+                    saved += 1
+                elif name.endswith(".zip"):
+                    extract_zip_to_inputs(tmp, cap)
+                    saved += 1
+            finally:
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
     except Exception as e:
         logging.warning(f"Attachment processing failed for message {mid}: {e}")
+        cap.errors.append(f"attachments: {e}")
     return saved
 
-def handle_links(subject: str, body_html: str) -> int:
+def handle_links(subject: str, body_html: str, cap: Capture) -> int:
     if not body_html:
         return 0
-    soup = BeautifulSoup(body_html, "lxml")
     saved = 0
     probed = 0
-    for a in soup.find_all("a", href=True):
+    actions = []    # in anchor order: (url, None) = queue, (url, future) = download attempt
+    for rec in iter_links(body_html):
         if probed >= MAX_LINKS_PER_MESSAGE:
             print("  [!] link cap reached; skipping rest")
             break
-        raw = a["href"]
-        url = unwrap_safelink(raw) if is_safelink(raw) else raw
-        h = host(url)
+        url, h = rec.url, rec.host
 
         if h in GATED_TRACKING_HOSTS:
-            logging.info(f"GATED host (skip): {raw}")
-            write_queue_append(url, subject)
+            logging.info(f"GATED host (skip): {rec.raw}")
+            actions.append((url, None))
             probed += 1
             continue
 
-        path = urlparse(url).path.lower()
-        if not (any(h.endswith(d) for d in BROKER_LINK_DOMAINS) or path.endswith(".pdf") or path.endswith(".zip")):
+        if not (any(h.endswith(d) for d in BROKER_LINK_DOMAINS) or rec.kind):
             logging.info(f"Non-allowlisted link (queue): {url}")
-            write_queue_append(url, subject)
+            actions.append((url, None))
             probed += 1
             continue
 
-        got = download_link(url)
+        # Direct .pdf/.zip links are always tried: a gated host or one earlier timeout
+        # must not send them to the GUI clicker
+        verdict = LINKS.get(url) if LINKS is not None and not rec.kind else None
+        if verdict in (GATED, DEAD):
+            logging.info(f"Cached {verdict} (queue): {url}")
+            actions.append((url, None))
+            probed += 1
+            continue
+
+        link_cap = Capture()
+        actions.append((url, (submit_link(download_link, rec, link_cap, verdict), link_cap)))
+        probed += 1
+
+    for url, pending in actions:
+        if pending is None:
+            cap.queue.append(url)
+            continue
+        fut, link_cap = pending
+        got = fut.result()
+        cap.files.extend(link_cap.files)
         if got > 0:
             saved += got
         else:
             logging.info(f"GUI/NDA (queue): {url}")
-            write_queue_append(url, subject)
-        probed += 1
+            cap.queue.append(url)
     return saved
 
+def process_message(m):
+    """Fetch attachments and probe links for one message. Returns (capture, a_saved, l_saved)."""
+    cap = Capture()
+    subject = (m.get("subject") or "").strip()
+    body = (m.get("body", {}) or {}).get("content", "")
+    a_saved = handle_attachments(m["id"], cap) if m.get("hasAttachments") else 0
+    l_saved = handle_links(subject, body, cap)
+    return cap, a_saved, l_saved
+
 def main():
+    global LINK_POOL, QUEUE, LINKS
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=INTAKE_WORKERS,
+                    help="messages processed in parallel (1 = serial)")
+    ap.add_argument("--full", action="store_true",
+                    help="ignore the sync cursor and re-read the newest GRAPH_TOP messages")
+    args = ap.parse_args()
+
     missing = [k for k, v in {
         "GRAPH_TENANT_ID": TENANT,
         "GRAPH_CLIENT_ID": CID,
@@ -278,31 +654,79 @@ def main():
 
     print("[intake] starting...")
     try:
-        tok = token()
-    except RuntimeError as e:
+        token()
+    except (RuntimeError, TimeoutError) as e:       # TimeoutError: token cache lock held by another run
         print(f"[intake] auth failed: {e}")
         return
 
-    base = f"https://graph.microsoft.com/v1.0/users/{MAILBOX}/mailFolders/{FOLDER}/messages"
-    params = f"?$top={TOP}&$orderby=receivedDateTime desc&$select=id,subject,from,hasAttachments,body"
+    cursor = load_cursor()
+    failures = dict((cursor or {}).get("failed") or {})     # message id -> runs with failed attachments
+    if cursor and not cursor.get("received"):
+        cursor = None
     try:
-        data = gget(base + params, tok)
+        msgs = fetch_messages(cursor, args.full)
     except Exception as e:
         print(f"[intake] fetch failed: {e}")
         return
+    QUEUE = GatedQueue()
+    LINKS = LinkCache()
+    print(f"[intake] {len(msgs)} new message(s)" + (f" since {cursor['received']}" if cursor and not args.full else ""))
+    workers = max(1, args.workers)
+    msg_pool = None
+    if workers > 1:
+        msg_pool = ThreadPoolExecutor(workers, thread_name_prefix="msg")
+        LINK_POOL = ThreadPoolExecutor(workers * 2, thread_name_prefix="link")
+        results = msg_pool.map(process_message, msgs)   # yields in message order
+    else:
+        results = map(process_message, msgs)
 
     pulled = 0
-    for i, m in enumerate(data.get("value", []), 1):
-        subject = (m.get("subject") or "").strip()
-        print(f"[intake] message {i}: {subject[:72]}")
-        mid = m["id"]
-        body = (m.get("body", {}) or {}).get("content", "")
-
-        a_saved = handle_attachments(mid, tok) if m.get("hasAttachments") else 0
-        l_saved = handle_links(subject, body)
-        if (a_saved + l_saved) > 0:
-            pulled += 1
-            logging.info(f"Message pulled: attachments={a_saved} links={l_saved} subj='{subject[:120]}'")
+    # The cursor stops at the first message with a failed attachment fetch so the next
+    # run sees it again (later messages are re-read too; their files dedupe by hash).
+    # After MESSAGE_RETRIES runs the message is given up on and the cursor moves past it.
+    # Retry counts are saved even before there is a cursor, so a first run held at its
+    # first message still counts towards the limit.
+    held = False
+    try:
+        for i, (m, (cap, a_saved, l_saved)) in enumerate(zip(msgs, results), 1):
+            subject = (m.get("subject") or "").strip()
+            print(f"[intake] message {i}: {subject[:72]}")
+            commit(cap, subject)
+            if cap.errors and not held:
+                n = failures.get(m["id"], 0) + 1
+                if n < MESSAGE_RETRIES:
+                    failures[m["id"]] = n
+                    held = True
+                    logging.warning(f"Message kept for retry ({n}/{MESSAGE_RETRIES}): '{subject[:120]}' "
+                                    f"{'; '.join(cap.errors)}")
+                else:
+                    failures.pop(m["id"], None)
+                    logging.error(f"Giving up on message after {n} tries: '{subject[:120]}' {'; '.join(cap.errors)}")
+            elif not cap.errors:
+                failures.pop(m["id"], None)
+            if not held:
+                cursor = advance_cursor(cursor, m)
+            if cursor or failures:
+                save_cursor(dict(cursor or {"received": None, "ids": []}, failed=failures))
+            if (a_saved + l_saved) > 0:
+                pulled += 1
+                logging.info(f"Message pulled: attachments={a_saved} links={l_saved} subj='{subject[:120]}'")
+    finally:
+        if msg_pool:
+            msg_pool.shutdown()
+            LINK_POOL.shutdown()
+            LINK_POOL = None
+
+    try:
+        QUEUE.export_json()
+    except Exception as e:
+        logging.warning(f"Queue export failed: {e}")
+    QUEUE.close()
+    logging.info(LINKS.summary())
+    try:
+        LINKS.save()
+    except Exception as e:
+        logging.warning(f"Link cache save failed: {e}")
 
     print(f"[intake] done. messages with captured files: {pulled}. log: {LOG_PATH}")
     logging.info(f"Intake complete. Messages with captured files: {pulled}")
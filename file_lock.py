@@ -0,0 +1,51 @@
+# file_lock.py
+# Cross-process advisory lock on a sidecar file (msvcrt on Windows, fcntl elsewhere),
+# for state files that several scripts or parallel runs read-modify-write.
+#
+#   with file_lock(path + ".lock"):
+#       ...read / write path...
+
+import os, time
+from contextlib import contextmanager
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+def _try_lock(fd):
+    if msvcrt:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+def _unlock(fd):
+    if msvcrt:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+@contextmanager
+def file_lock(path, timeout=30.0, poll=0.05):
+    """Hold an exclusive lock on `path` (created if missing); TimeoutError after `timeout` s."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    locked = False
+    try:
+        deadline = time.monotonic() + timeout
+        while not locked:
+            try:
+                _try_lock(fd)
+                locked = True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"could not lock {path} within {timeout:g}s")
+                time.sleep(poll)
+        yield
+    finally:
+        if locked:
+            _unlock(fd)
+        os.close(fd)
@@ -0,0 +1,149 @@
+# folder_watch.py
+# Reports files dropped into a folder once they have finished arriving.
+# - Filesystem events through watchdog when it is installed (plus a slow rescan in
+#   case an event is missed), otherwise a directory scan every `poll` seconds
+# - Debounce: a file is handed out only after its size and mtime have held still for
+#   `settle` seconds and it can be opened (the writer has let go of it); in-progress
+#   downloads (*.part, *.crdownload, ...) are never matched
+# - Each version of a file is reported once; a rewrite with new size/mtime is reported again
+#
+#   python folder_watch.py Inputs [--settle 2]   (print files as they settle)
+
+import os, time, queue, argparse
+
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".partial", ".tmp", ".download")
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+class _Events(FileSystemEventHandler):
+    def __init__(self, q):
+        self.q = q
+
+    def on_any_event(self, event):
+        if not event.is_directory:
+            self.q.put(getattr(event, "dest_path", None) or event.src_path)
+
+class FolderWatcher:
+    def __init__(self, folder, suffixes=(".pdf",), settle=2.0, poll=2.0, rescan=60.0, use_events=True):
+        self.folder = folder
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.settle, self.poll, self.rescan = settle, poll, rescan
+        self.pending = {}           # path -> ((size, mtime_ns), since)
+        self.seen = {}              # path -> (size, mtime_ns) already reported
+        self.events = queue.Queue()
+        self.observer = None
+        if use_events and Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(_Events(self.events), folder, recursive=False)
+            self.observer.start()
+        self.mode = "watchdog events" if self.observer else f"polling every {poll:g}s"
+        self.next_scan = 0.0
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+
+    def _wanted(self, path):
+        name = os.path.basename(path).lower()
+        return name.endswith(self.suffixes) and not name.endswith(PARTIAL_SUFFIXES) and not name.startswith(("~$", "."))
+
+    def _listing(self):
+        try:
+            return [e.path for e in os.scandir(self.folder) if e.is_file() and self._wanted(e.path)]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _sig(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _touch(self, path, now):
+        if not path or not self._wanted(path) or path in self.pending:
+            return
+        sig = self._sig(path)
+        if sig and self.seen.get(path) != sig:
+            self.pending[path] = (sig, now)
+
+    def _scan(self, now):
+        present = set(self._listing())
+        for path in present:
+            self._touch(path, now)
+        for path in [p for p in self.seen if p not in present]:
+            del self.seen[path]
+
+    def _settled(self, now):
+        out = []
+        for path, (sig, since) in list(self.pending.items()):
+            cur = self._sig(path)
+            if cur is None:
+                del self.pending[path]
+            elif cur != sig:
+                self.pending[path] = (cur, now)         # still growing: restart the clock
+            elif now - since >= self.settle and cur[0] > 0:
+                try:
+                    open(path, "rb").close()            # fails while the writer holds it (Windows)
+                except OSError:
+                    continue
+                del self.pending[path]
+                self.seen[path] = cur
+                out.append(path)
+        return sorted(out)
+
+    def ready(self, timeout=None):
+        """Block until at least one file has settled (or `timeout` s pass); returns their paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self.next_scan:
+                self._scan(now)
+                self.next_scan = now + (self.rescan if self.observer else self.poll)
+            out = self._settled(now)
+            if out:
+                return out
+            if deadline is not None and now >= deadline:
+                return []
+            waits = [self.next_scan - now]
+            if self.pending:
+                waits.append(min(0.25, self.settle))
+            if deadline is not None:
+                waits.append(deadline - now)
+            try:
+                path = self.events.get(timeout=max(0.01, min(waits)))
+                while True:
+                    self._touch(path, time.monotonic())
+                    path = self.events.get_nowait()
+            except queue.Empty:
+                pass
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("folder")
+    ap.add_argument("--suffix", nargs="+", default=[".pdf"])
+    ap.add_argument("--settle", type=float, default=2.0)
+    ap.add_argument("--poll", type=float, default=2.0)
+    ap.add_argument("--no-events", action="store_true", help="poll even when watchdog is installed")
+    args = ap.parse_args()
+
+    w = FolderWatcher(args.folder, args.suffix, args.settle, args.poll, use_events=not args.no_events)
+    print(f"Watching {args.folder} ({w.mode}); Ctrl+C to stop")
+    try:
+        while True:
+            for path in w.ready():
+                print(f"{time.strftime('%H:%M:%S')} settled: {os.path.basename(path)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        w.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# gated_queue.py
+# SQLite-backed queue of gated broker links (Logs\gated_queue.db).
+# - URLs are indexed by a canonical form (SafeLinks unwrapped, tracking params
+#   stripped, host lowercased, fragment dropped), so a link seen again is not requeued
+# - Writes are buffered by add() and committed by flush() in one transaction
+# - Status: pending -> attempted -> done / failed; claim() hands pending work to a clicker.
+#   A claim is a lease: links left 'attempted' longer than LEASE_MIN (a clicker that
+#   crashed before mark()) go back to pending on the next claim()
+# - export_json() rewrites Logs\gated_queue.json (open items) once per run for
+#   tools that still edit the JSON file (queue_prune.py, broker_clicker_playwright.py).
+#   Their edits are read back first: an exported link gone from the file is 'removed',
+#   a changed "status" is applied, and a link they added is queued
+#
+#   python gated_queue.py stats
+#   python gated_queue.py list [--status pending]
+#   python gated_queue.py export
+#   python gated_queue.py retry-failed
+#   python gated_queue.py requeue-stale [--lease 60]
+
+import os, json, sqlite3, argparse
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, urlunparse, parse_qs, parse_qsl, urlencode, unquote
+
+ROOT = os.getcwd()
+LOGS = os.path.join(ROOT, "Logs")
+QUEUE_DB = os.path.join(LOGS, "gated_queue.db")
+QUEUE_JSON = os.path.join(LOGS, "gated_queue.json")
+
+STATUSES = ("pending", "attempted", "done", "failed", "removed")
+LEASE_MIN = float(os.getenv("GATED_LEASE_MIN", "60"))     # minutes a claimed link may stay 'attempted'
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "_hsenc", "_hsmi", "mkt_tok",
+                   "trk", "trkid", "ref", "cmpid", "sfmc_id", "et_rid", "s_cid"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    canon        TEXT PRIMARY KEY,
+    url          TEXT NOT NULL,
+    subject      TEXT,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    queued_at    TEXT NOT NULL,
+    last_seen    TEXT NOT NULL,
+    seen_count   INTEGER NOT NULL DEFAULT 1,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    last_attempt TEXT,
+    error        TEXT,
+    exported     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS links_status ON links (status, queued_at);
+"""
+
+def _utcnow(minus_min=0):
+    return (datetime.utcnow() - timedelta(minutes=minus_min)).isoformat() + "Z"
+
+def canonical_url(url: str) -> str:
+    try:
+        p = urlparse(url.strip())
+        if "safelinks.protection.outlook.com" in p.netloc.lower():
+            target = parse_qs(p.query).get("url", [None])[0]
+            if target:
+                p = urlparse(unquote(target))
+        netloc = p.netloc.lower()
+        if (p.scheme == "https" and netloc.endswith(":443")) or (p.scheme == "http" and netloc.endswith(":80")):
+            netloc = netloc.rsplit(":", 1)[0]
+        query = sorted((k, v) for k, v in parse_qsl(p.query, keep_blank_values=True)
+                       if not (k.lower().startswith("utm_") or k.lower() in TRACKING_PARAMS))
+        return urlunparse((p.scheme.lower(), netloc, p.path or "/", p.params, urlencode(query), ""))
+    except Exception:
+        return url.strip()
+
+class GatedQueue:
+    def __init__(self, path=QUEUE_DB, legacy_json=QUEUE_JSON):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        if "exported" not in [r[1] for r in self.db.execute("PRAGMA table_info(links)")]:
+            self.db.execute("ALTER TABLE links ADD COLUMN exported INTEGER NOT NULL DEFAULT 0")
+        self.buffer = []
+        empty = self.db.execute("SELECT COUNT(*) FROM links").fetchone()[0] == 0
+        if empty and legacy_json and os.path.exists(legacy_json):
+            self._import_json(legacy_json)
+
+    def close(self):
+        self.db.close()
+
+    def _import_json(self, path):
+        """Seed the store from an existing gated_queue.json (first run only)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f).get("queue", [])
+        except (ValueError, AttributeError):
+            return
+        for it in items:
+            if it.get("url"):
+                self.add(it["url"], it.get("subject") or "", it.get("queued_at"))
+        self.flush()
+
+    def add(self, url: str, subject: str, queued_at=None):
+        self.buffer.append((canonical_url(url), url, (subject or "")[:200], queued_at or _utcnow()))
+
+    def flush(self):
+        """Commit buffered links in one transaction. Returns the URLs that were new."""
+        if not self.buffer:
+            return []
+        new = []
+        with self.db:
+            self.db.execute("BEGIN")
+            for canon, url, subject, ts in self.buffer:
+                cur = self.db.execute(
+                    "INSERT INTO links (canon, url, subject, queued_at, last_seen) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(canon) DO NOTHING", (canon, url, subject, ts, ts))
+                if cur.rowcount:
+                    new.append(url)
+                else:
+                    self.db.execute("UPDATE links SET last_seen = ?, seen_count = seen_count + 1 WHERE canon = ?",
+                                    (ts, canon))
+        self.buffer = []
+        return new
+
+    def requeue_stale(self, lease_min=LEASE_MIN):
+        """Links claimed more than lease_min minutes ago and never marked -> pending."""
+        return self.db.execute("UPDATE links SET status = 'pending' WHERE status = 'attempted' AND last_attempt < ?",
+                               (_utcnow(lease_min),)).rowcount
+
+    def claim(self, n=10, lease_min=LEASE_MIN):
+        """Move up to n pending links to 'attempted' and return them (oldest first).
+        Expired claims are requeued first."""
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.requeue_stale(lease_min)
+            rows = self.db.execute("SELECT canon, url, subject, queued_at FROM links WHERE status = 'pending' "
+                                   "ORDER BY queued_at LIMIT ?", (n,)).fetchall()
+            self.db.executemany("UPDATE links SET status = 'attempted', attempts = attempts + 1, last_attempt = ? "
+                                "WHERE canon = ?", [(_utcnow(), r[0]) for r in rows])
+        return [dict(zip(("canon", "url", "subject", "queued_at"), r)) for r in rows]
+
+    def mark(self, url: str, status: str, error=None):
+        if status not in STATUSES:
+            raise ValueError(f"unknown status {status!r}")
+        self.db.execute("UPDATE links SET status = ?, error = ? WHERE canon = ?", (status, error, canonical_url(url)))
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM links GROUP BY status").fetchall())
+
+    def import_json_changes(self, path=QUEUE_JSON):
+        """Apply edits made to the exported JSON by other tools. Returns (removed, updated, added)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f).get("queue", [])
+        except (OSError, ValueError, AttributeError):
+            return 0, 0, 0          # missing / unreadable file: nothing to reconcile
+        in_file = {}
+        for it in items:
+            if isinstance(it, dict) and it.get("url"):
+                in_file[canonical_url(it["url"])] = it
+        removed = updated = 0
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            for canon, status in self.db.execute("SELECT canon, status FROM links WHERE exported = 1").fetchall():
+                it = in_file.pop(canon, None)
+                if it is None:
+                    if status in ("pending", "attempted"):
+                        removed += self.db.execute("UPDATE links SET status = 'removed', error = ? WHERE canon = ?",
+                                                   ("removed from gated_queue.json", canon)).rowcount
+                elif it.get("status") in STATUSES and it["status"] != status and status in ("pending", "attempted"):
+                    updated += self.db.execute("UPDATE links SET status = ?, error = ? WHERE canon = ?",
+                                               (it["status"], it.get("error"), canon)).rowcount
+        for it in in_file.values():
+            self.add(it["url"], it.get("subject") or "", it.get("queued_at"))
+        added = len(self.flush())
+        return removed, updated, added
+
+    def export_json(self, path=QUEUE_JSON):
+        """Read back edits to the JSON, then rewrite it with the open links."""
+        removed, updated, added = self.import_json_changes(path)
+        if removed or updated or added:
+            print(f"gated_queue.json edits: {removed} removed, {updated} status changes, {added} added")
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute("SELECT canon, url, subject, queued_at, status FROM links "
+                                   "WHERE status IN ('pending', 'attempted') ORDER BY queued_at").fetchall()
+            self.db.execute("UPDATE links SET exported = 0 WHERE exported = 1")
+            self.db.executemany("UPDATE links SET exported = 1 WHERE canon = ?", [(r[0],) for r in rows])
+            q = {"queue": [{"url": u, "subject": s, "queued_at": t, "status": st} for _, u, s, t, st in rows]}
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(q, f, indent=2)
+            os.replace(tmp, path)
+        return len(rows)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["stats", "list", "export", "retry-failed", "requeue-stale"])
+    ap.add_argument("--lease", type=float, default=LEASE_MIN, help="minutes (requeue-stale)")
+    ap.add_argument("--status", choices=STATUSES)
+    ap.add_argument("--db", default=QUEUE_DB)
+    args = ap.parse_args()
+
+    q = GatedQueue(args.db)
+    if args.cmd == "stats":
+        counts = q.counts()
+        print("  ".join(f"{s}={counts.get(s, 0)}" for s in STATUSES))
+    elif args.cmd == "list":
+        sql = "SELECT status, queued_at, seen_count, url FROM links"
+        rows = q.db.execute(sql + (" WHERE status = ?" if args.status else "") + " ORDER BY queued_at",
+                            (args.status,) if args.status else ()).fetchall()
+        for status, ts, seen, url in rows:
+            print(f"{status:<9} {ts:<28} x{seen:<3} {url}")
+    elif args.cmd == "export":
+        print(f"Exported {q.export_json()} open links -> {QUEUE_JSON}")
+    elif args.cmd == "requeue-stale":
+        print(f"Requeued {q.requeue_stale(args.lease)} stale claims")
+    else:
+        n = q.db.execute("UPDATE links SET status = 'pending' WHERE status = 'failed'").rowcount
+        print(f"Requeued {n} failed links")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# link_cache.py
+# Persistent classification of broker links (Logs\link_cache.json) so a link that is
+# already known to be a direct download, GUI/NDA-gated or dead is not probed again.
+# - Per-URL verdicts keyed on gated_queue.canonical_url, each with its own TTL;
+#   negative verdicts (gated/dead) expire sooner than downloadable ones, dead soonest
+# - Per-host tallies: a host that has only ever produced gated pages (HOST_GATED_MIN
+#   verdicts, none downloadable) is cached as gated for every URL on it
+# - Thread-safe; loaded once per run, expired entries dropped and saved atomically at the end
+# - hits/misses counted per run (the router writes them to Logs\email_intake.log)
+#
+#   python link_cache.py stats
+#   python link_cache.py list
+#   python link_cache.py clear [--host example.com]
+
+import os, json, time, argparse, threading
+from collections import Counter
+from urllib.parse import urlparse
+from gated_queue import canonical_url
+
+ROOT = os.getcwd()
+LINK_CACHE = os.path.join(ROOT, "Logs", "link_cache.json")
+
+DOWNLOADABLE, GATED, DEAD = "downloadable", "gated", "dead"
+HOUR = 3600
+TTL = {
+    DOWNLOADABLE: float(os.getenv("LINK_TTL_DOWNLOADABLE_H", "168")) * HOUR,
+    GATED:        float(os.getenv("LINK_TTL_GATED_H", "72")) * HOUR,
+    DEAD:         float(os.getenv("LINK_TTL_DEAD_H", "12")) * HOUR,
+}
+HOST_TTL = float(os.getenv("LINK_TTL_HOST_H", "168")) * HOUR
+HOST_GATED_MIN = int(os.getenv("HOST_GATED_MIN", "3"))
+
+class LinkCache:
+    def __init__(self, path=LINK_CACHE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.urls, self.hosts = {}, {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.urls, self.hosts = data.get("urls", {}), data.get("hosts", {})
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def _host_gated(self, h, now):
+        ent = self.hosts.get(h)
+        return bool(ent and now - ent["at"] < HOST_TTL and
+                    ent.get(GATED, 0) >= HOST_GATED_MIN and not ent.get(DOWNLOADABLE, 0))
+
+    def get(self, url):
+        """Cached verdict for url (or its host), or None if unknown/expired. Counts hits/misses."""
+        key, now = canonical_url(url), time.time()
+        with self.lock:
+            ent = self.urls.get(key)
+            if ent and now - ent["at"] < TTL[ent["v"]]:
+                self.stats["hit"] += 1
+                self.stats["hit_" + ent["v"]] += 1
+                return ent["v"]
+            if self._host_gated(urlparse(key).netloc, now):
+                self.stats["hit"] += 1
+                self.stats["hit_host"] += 1
+                return GATED
+            self.stats["miss"] += 1
+            return None
+
+    def put(self, url, verdict, host=True):
+        """host=False records the URL verdict without counting it toward host gating."""
+        key, now = canonical_url(url), time.time()
+        h = urlparse(key).netloc
+        with self.lock:
+            self.urls[key] = {"v": verdict, "at": now}
+            if verdict != DEAD and host:
+                ent = self.hosts.get(h)
+                if ent is None or now - ent["at"] >= HOST_TTL:
+                    ent = self.hosts[h] = {GATED: 0, DOWNLOADABLE: 0}
+                ent[verdict] += 1
+                ent["at"] = now
+            self.stats["put_" + verdict] += 1
+
+    def summary(self):
+        s = self.stats
+        return (f"Link cache: hits={s['hit']} misses={s['miss']} "
+                f"(downloadable={s['hit_downloadable']} gated={s['hit_gated']} dead={s['hit_dead']} "
+                f"host={s['hit_host']}) new verdicts={s['put_downloadable'] + s['put_gated'] + s['put_dead']} "
+                f"entries={len(self.urls)}")
+
+    def save(self):
+        now = time.time()
+        with self.lock:
+            self.urls = {k: e for k, e in self.urls.items() if now - e["at"] < TTL[e["v"]]}
+            self.hosts = {h: e for h, e in self.hosts.items() if now - e["at"] < HOST_TTL}
+            data = {"urls": self.urls, "hosts": self.hosts}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["stats", "list", "clear"])
+    ap.add_argument("--host", help="clear only entries for this host")
+    ap.add_argument("--path", default=LINK_CACHE)
+    args = ap.parse_args()
+
+    c = LinkCache(args.path)
+    now = time.time()
+    if args.cmd == "stats":
+        live = Counter(e["v"] for e in c.urls.values() if now - e["at"] < TTL[e["v"]])
+        gated_hosts = [h for h in c.hosts if c._host_gated(h, now)]
+        print(f"Link cache: {args.path}")
+        print(f"  urls: {sum(live.values())} live ({len(c.urls)} stored)  " +
+              "  ".join(f"{v}={live.get(v, 0)}" for v in (DOWNLOADABLE, GATED, DEAD)))
+        print(f"  hosts cached as gated: {len(gated_hosts)}" + (f"  ({', '.join(sorted(gated_hosts))})" if gated_hosts else ""))
+    elif args.cmd == "list":
+        for key, e in sorted(c.urls.items(), key=lambda kv: kv[1]["at"]):
+            left = (TTL[e["v"]] - (now - e["at"])) / HOUR
+            print(f"{e['v']:<12} {'expired' if left <= 0 else f'{left:6.1f}h':>8}  {key}")
+    else:
+        if args.host:
+            h = args.host.lower()
+            c.urls = {k: e for k, e in c.urls.items() if urlparse(k).netloc != h}
+            c.hosts.pop(h, None)
+        else:
+            c.urls, c.hosts = {}, {}
+        c.save()
+        print("Link cache cleared" + (f" for {args.host}" if args.host else ""))
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,13 @@ setlocal
 
 cd /d "C:\Users\Brent Jackson\Desktop\Frontier\Ranier\HAWK - Rainier"
 
-:: Crexi
-python universal_ocr_automation.py "https://www.crexi.com"
-
-:: Dropbox
-python universal_ocr_automation.py "https://www.dropbox.com/login"
-
-:: Box
-python universal_ocr_automation.py "https://account.box.com/login"
-
-:: 10x
-python universal_ocr_automation.py "https://www.10x.com"
-
-:: CoStar
-python universal_ocr_automation.py "https://www.costar.com"
+:: Crexi, Dropbox, Box, 10x, CoStar - one browser window, one OCR engine
+python universal_ocr_automation.py ^
+  "https://www.crexi.com" ^
+  "https://www.dropbox.com/login" ^
+  "https://account.box.com/login" ^
+  "https://www.10x.com" ^
+  "https://www.costar.com"
 
 endlocal
 pause
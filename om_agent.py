@@ -1,5 +1,20 @@
 # om_agent.py (single-parser version)
-import os, json, hashlib, subprocess
+# Runs normalize -> summary -> label in-process: each stage module is imported once
+# per run and the normalized payload is handed between stages in memory.
+# Each OM's metrics and label are upserted into the portfolio table (om_summary).
+# Extraction results are cached by PDF hash + normalizer version (om_cache), so
+# `--relabel` after a guardrails.yaml change only reruns summary/label.
+# Processed state lives in Logs\om_state.db (om_state): per-stage status is written
+# as each stage finishes, so an interrupted run resumes where it stopped, and an
+# unchanged PDF (same size/mtime/file id) is not re-read; `--verify` rehashes all.
+# `--watch` keeps running after the initial pass: PDFs that land in Inputs are picked
+# up as soon as they finish writing (folder_watch) and go to the same warm workers.
+import os, json, time, argparse
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import om_normalizer_basic, om_summary, color_labeler
+from om_cache import ResultCache
+from om_state import StateStore
 
 ROOT = os.getcwd()
 INPUT_DIR  = os.path.join(ROOT, "Inputs")
@@ -8,74 +23,304 @@ SCORE_DIR  = os.path.join(ROOT, r"Outputs\Scorecards\OM_INTAKE")
 REVIEWROOT = os.path.join(ROOT, r"Outputs\Review")
 CONFIG_YAML= os.path.join(ROOT, r"Config\guardrails.yaml")
 LOGS_DIR   = os.path.join(ROOT, "Logs")
-STATE_PATH = os.path.join(LOGS_DIR, "processed_files.json")
+STATE_PATH = os.path.join(LOGS_DIR, "processed_files.json")   # legacy; imported once into STATE_DB
+STATE_DB   = os.path.join(LOGS_DIR, "om_state.db")
+LABELS_CSV = r"Outputs\labels_log.csv"
+PORTFOLIO_DB = om_summary.PORTFOLIO_DB
 
 os.makedirs(NORM_DIR, exist_ok=True)
 os.makedirs(SCORE_DIR, exist_ok=True)
 os.makedirs(REVIEWROOT, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
 
-def file_hash(path):
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+def _stage_runner(on_stage):
+    """Wrap a stage body so on_stage sees start/done/failed events with durations."""
+    def run(stage, fn):
+        if on_stage: on_stage("start", stage, None)
+        t = time.monotonic()
+        try:
+            out = fn()
+        except Exception as e:
+            if on_stage: on_stage("failed", stage, {"secs": round(time.monotonic() - t, 3), "error": str(e)})
+            raise
+        if on_stage: on_stage("done", stage, {"secs": round(time.monotonic() - t, 3)})
+        return out
+    return run
 
-def load_state():
-    if not os.path.exists(STATE_PATH):
-        return {"processed": []}
-    with open(STATE_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_state(state):
-    with open(STATE_PATH, "w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2)
-
-def process_pdf(pdf_path):
+def process_pdf(pdf_path, G, labels_csv=LABELS_CSV, sha=None, cache=None, done=(), on_stage=None):
+    """Run all stages for one PDF, skipping those in `done` (resume).
+    Returns (processed, label_row); stage progress is reported through on_stage."""
+    stage = _stage_runner(on_stage)
     base = os.path.splitext(os.path.basename(pdf_path))[0].replace(" ", "_")
-    # 1) normalize (generic only)
-    subprocess.run(["python", "om_normalizer_basic.py",
-                    "--pdf", pdf_path,
-                    "--bucket", "OM_INTAKE",
-                    "--outroot", r"Outputs\Normalized"],
-                   check=False)
-    norm_json = os.path.join(NORM_DIR, f"{base}.json")
-    if not os.path.exists(norm_json):
-        print(f"Skip (no normalized JSON): {os.path.basename(pdf_path)}")
-        return False
+    norm_json = os.path.join(r"Outputs\Normalized", "OM_INTAKE", f"{base}.json")
+
+    # 1) normalize (generic only); reuse cached extraction when available
+    def normalize():
+        extracted = cache.get(sha) if (cache and sha) else None
+        if extracted is None:
+            extracted = om_normalizer_basic.extract(pdf_path)
+            if cache and sha:
+                cache.put(sha, extracted)
+        else:
+            print(f"Cache hit: {os.path.basename(pdf_path)}")
+        return om_normalizer_basic.normalize(pdf_path, "OM_INTAKE", r"Outputs\Normalized", extracted)
+    try:
+        if "normalized" in done and os.path.exists(norm_json):
+            with open(norm_json, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            print(f"Resume: {os.path.basename(pdf_path)} ({', '.join(sorted(done))} already done)")
+        else:
+            meta, norm_json = stage("normalized", normalize)
+    except Exception as e:
+        print(f"Skip (normalize failed: {e}): {os.path.basename(pdf_path)}")
+        return False, None
 
     # 2) summary
-    subprocess.run(["python", "om_summary.py",
-                    "--bucket", "OM_INTAKE",
-                    "--norm", norm_json,
-                    "--outdir", r"Outputs\Scorecards"],
-                   check=False)
-
-    # 3) color label (copies PDF into Outputs\Review\{color})
-    subprocess.run(["python", "color_labeler.py",
-                    "--norm", norm_json,
-                    "--config", CONFIG_YAML,
-                    "--reviewroot", r"Outputs\Review",
-                    "--labels_csv", r"Outputs\labels_log.csv"],
-                   check=False)
+    if "summarized" not in done:
+        try:
+            stage("summarized", lambda: om_summary.summarize(meta, norm_json, "OM_INTAKE", r"Outputs\Scorecards",
+                                                             sha, PORTFOLIO_DB))
+        except Exception as e:
+            print(f"Summary failed: {os.path.basename(pdf_path)}: {e}")
+
+    # 3) color label (copies PDF into Outputs\Review\{color}); portfolio row gets the label
+    def label():
+        row = color_labeler.label(meta, norm_json, G, r"Outputs\Review", labels_csv)
+        if sha and row:
+            om_summary.upsert_label(sha, row, PORTFOLIO_DB)
+        return row
+    row = None
+    if "labeled" not in done:
+        try:
+            row = stage("labeled", label)
+        except Exception as e:
+            print(f"Label failed: {os.path.basename(pdf_path)}: {e}")
     print(f"Processed: {os.path.basename(pdf_path)}")
-    return True
+    return True, row
+
+def _record(store, sha, name, event, stage, info):
+    if event == "start":
+        store.start_stage(sha, name, stage)
+    else:
+        store.finish_stage(sha, stage, info["secs"], info.get("error"))
+
+# ---------- Worker pool ----------
+# Each worker is a long-lived process (parser imports stay warm) talking to the
+# coordinator over its own pipe. Workers never touch the state store (om_state.db) or the
+# labels log; the coordinator commits results in input order so the output
+# matches a serial run. A worker that overruns --timeout is killed and replaced.
+
+def _worker(conn, G, cache):
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        idx, (pdf, sha, done) = job
+        on_stage = lambda event, stage, info: conn.send(("stage", idx, event, stage, info))
+        try:
+            ok, row = process_pdf(pdf, G, labels_csv=None, sha=sha, cache=cache, done=done, on_stage=on_stage)
+        except Exception as e:
+            print(f"Worker error: {os.path.basename(pdf)}: {e}")
+            ok, row = False, None
+        conn.send(("result", idx, ok, row))
+    conn.close()
+
+def _spawn_worker(G, cache):
+    parent, child = mp.Pipe()
+    p = mp.Process(target=_worker, args=(child, G, cache), daemon=True)
+    p.start()
+    child.close()
+    return {"proc": p, "conn": parent, "job": None, "started": 0.0}
+
+def _stop_workers(slots):
+    for s in slots:
+        try:
+            s["conn"].send(None)
+        except Exception:
+            pass
+        s["proc"].join(timeout=5)
+        if s["proc"].is_alive():
+            s["proc"].terminate()
+
+def run_parallel(jobs, G, workers, timeout, cache=None, on_stage=None, slots=None):
+    """Yield (index, processed, label_row) for jobs=[(pdf, sha, done_stages), ...] in
+    completion order; stage events are forwarded to on_stage(index, event, stage, info).
+    Pass `slots` to reuse an existing pool (left running afterwards)."""
+    pending = list(enumerate(jobs))[::-1]
+    own = slots is None
+    if own:
+        slots = [_spawn_worker(G, cache) for _ in range(min(workers, len(jobs)))]
+    try:
+        while pending or any(s["job"] is not None for s in slots):
+            for s in slots:
+                if s["job"] is None and pending:
+                    idx, job = pending.pop()
+                    s["conn"].send((idx, job))
+                    s["job"], s["started"] = idx, time.monotonic()
+
+            busy = [s for s in slots if s["job"] is not None]
+            ready = wait([s["conn"] for s in busy], timeout=0.5)
+            for s in busy:
+                idx = s["job"]
+                if s["conn"] in ready:
+                    try:
+                        msg = s["conn"].recv()
+                    except EOFError:              # worker died mid-file
+                        print(f"Worker crashed: {os.path.basename(jobs[idx][0])}")
+                        msg = ("result", idx, False, None)
+                        s.update(_spawn_worker(G, cache))
+                    if msg[0] == "stage":
+                        if on_stage: on_stage(idx, *msg[2:])
+                        continue
+                    s["job"] = None
+                    yield idx, msg[2], msg[3]
+                elif time.monotonic() - s["started"] > timeout:
+                    print(f"Timeout after {timeout}s: {os.path.basename(jobs[idx][0])}")
+                    s["proc"].terminate()
+                    s["proc"].join()
+                    s.update(_spawn_worker(G, cache))
+                    yield idx, False, None
+    finally:
+        if own:
+            _stop_workers(slots)
+
+def run_coordinated(jobs, G, workers, timeout, cache, store, slots=None):
+    """Coordinator side of --workers: the only writer of the state store and labels log.
+    Results (and the "labeled" stage, which includes the log row) commit in input order."""
+    held = {}
+    def on_stage(idx, event, stage, info):
+        pdf, sha, _ = jobs[idx]
+        if stage == "labeled" and event == "done":
+            held[idx] = info
+            return
+        _record(store, sha, os.path.basename(pdf), event, stage, info)
+
+    done, nxt = {}, 0
+    for idx, ok, row in run_parallel(jobs, G, workers, timeout, cache, on_stage, slots):
+        done[idx] = (ok, row)
+        while nxt in done:
+            ok, row = done.pop(nxt)
+            pdf, sha, _ = jobs[nxt]
+            if ok:
+                info = held.pop(nxt, None)
+                if row:
+                    try:
+                        color_labeler.append_label(LABELS_CSV, row)
+                    except Exception as e:
+                        print(f"Label log failed: {os.path.basename(pdf)}: {e}")
+                        info = dict(info or {}, error=str(e))
+                if info:
+                    store.finish_stage(sha, "labeled", info["secs"], info.get("error"))
+                store.mark_processed(sha, os.path.basename(pdf))
+            nxt += 1
+
+def make_job(store, pdf, verify=False, relabel=False, queued=None):
+    """(pdf, sha, done_stages) for a PDF that still needs work, else None.
+    queued ({sha: name} for the batch) skips a second copy of the same PDF under another name;
+    across batches the first copy is already processed."""
+    h = store.cached_hash(pdf, verify)
+    if not relabel and store.is_processed(h):
+        return None
+    if queued is not None:
+        if h in queued:
+            print(f"Duplicate of {queued[h]} (skip): {os.path.basename(pdf)}")
+            return None
+        queued[h] = os.path.basename(pdf)
+    if relabel:
+        store.reset_stages(h)
+    return (pdf, h, store.stages_done(h))
+
+def run_jobs(jobs, G, workers, timeout, cache, store, slots=None):
+    if workers <= 1:
+        for pdf, h, done in jobs:
+            on_stage = lambda event, stage, info, h=h, name=os.path.basename(pdf): _record(store, h, name, event, stage, info)
+            ok, _ = process_pdf(pdf, G, sha=h, cache=cache, done=done, on_stage=on_stage)
+            if ok:
+                store.mark_processed(h, os.path.basename(pdf))
+    else:
+        run_coordinated(jobs, G, workers, timeout, cache, store, slots)
+
+def watch(G, cache, store, args):
+    """Daemon loop: settled PDFs in Inputs -> jobs, on one long-lived worker pool
+    (or in-process with --workers 1; parser modules stay imported either way).
+    Files already handled by the initial pass are skipped by hash (make_job)."""
+    from folder_watch import FolderWatcher
+    watcher = FolderWatcher(INPUT_DIR, settle=args.settle, poll=args.poll)
+    spawn = lambda: [_spawn_worker(G, cache) for _ in range(args.workers)] if args.workers > 1 else None
+    slots = spawn()
+    print(f"Watching {INPUT_DIR} ({watcher.mode}, settle {args.settle:g}s, "
+          f"{args.workers} worker{'s' if args.workers > 1 else ''}); Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            jobs, queued = [], {}
+            for pdf in watcher.ready():
+                try:
+                    job = make_job(store, pdf, args.verify, queued=queued)
+                except OSError as e:            # moved / deleted between settling and hashing
+                    print(f"Watch: skipped {os.path.basename(pdf)}: {e}", flush=True)
+                    continue
+                except Exception as e:
+                    print(f"Watch: state lookup failed for {os.path.basename(pdf)}: {e}", flush=True)
+                    continue
+                if job:
+                    jobs.append(job)
+            if not jobs:
+                continue
+            t = time.monotonic()
+            try:
+                run_jobs(jobs, G, args.workers, args.timeout, cache, store, slots)
+                print(f"Watch: {len(jobs)} PDF(s) done in {time.monotonic() - t:.1f}s", flush=True)
+            except Exception as e:
+                print(f"Watch: batch of {len(jobs)} failed ({e}); continuing", flush=True)
+                if slots:                       # pool may hold half-finished jobs: start clean
+                    _stop_workers(slots)
+                    slots = spawn()
+    except KeyboardInterrupt:
+        print("Watch stopped")
+    finally:
+        watcher.stop()
+        if slots:
+            _stop_workers(slots)
 
 def main():
-    state = load_state()
-    seen = set(state.get("processed", []))
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=1, help="parallel PDF workers (1 = serial, in-process)")
+    ap.add_argument("--timeout", type=float, default=600, help="per-PDF timeout in seconds (worker mode)")
+    ap.add_argument("--relabel", action="store_true", help="rerun every PDF in Inputs, reusing cached extraction")
+    ap.add_argument("--no-cache", action="store_true", help="always re-parse; do not read or write om_cache")
+    ap.add_argument("--verify", action="store_true", help="rehash every PDF instead of trusting size/mtime")
+    ap.add_argument("--watch", action="store_true", help="keep running; process PDFs as they land in Inputs")
+    ap.add_argument("--settle", type=float, default=2.0, help="seconds a new PDF's size/mtime must hold still (--watch)")
+    ap.add_argument("--poll", type=float, default=2.0, help="scan interval when watchdog is not installed (--watch)")
+    args = ap.parse_args()
+    cache = None if args.no_cache else ResultCache()
+    store = StateStore(STATE_DB, STATE_PATH)
+
+    # guardrails.yaml read once per run
+    G = color_labeler.load_config(CONFIG_YAML) if os.path.exists(CONFIG_YAML) else {}
 
+    jobs, present, queued = [], set(), {}
     for name in os.listdir(INPUT_DIR):
         if not name.lower().endswith(".pdf"):
             continue
         pdf = os.path.join(INPUT_DIR, name)
-        h = file_hash(pdf)
-        if h in seen:
-            continue
-        if process_pdf(pdf):
-            seen.add(h)
-            save_state({"processed": list(seen)})
+        present.add(pdf)
+        job = make_job(store, pdf, args.verify, args.relabel, queued)
+        if job:
+            jobs.append(job)
+    store.prune_stat(present, INPUT_DIR)
+
+    try:
+        run_jobs(jobs, G, args.workers, args.timeout, cache, store)
+        if args.watch:
+            watch(G, cache, store, args)
+    finally:
+        store.close()
+
+    if cache:
+        n, freed = cache.prune()
+        if n:
+            print(f"Cache pruned: {n} entries ({freed / 1048576:.1f} MB)")
 
 if __name__ == "__main__":
     main()
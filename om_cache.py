@@ -0,0 +1,114 @@
+# om_cache.py
+# Content-addressed cache of normalizer extraction results.
+# - Key: SHA-256 of the PDF (om_state.file_hash) + NORMALIZER_VERSION
+# - Value: JSON with mtm_headline, property_metrics_hints and rentroll_tables
+# - Size-capped LRU: hits touch the entry's mtime, prune() drops oldest first
+#
+#   python om_cache.py stats
+#   python om_cache.py list [--stale]
+#   python om_cache.py prune [--max-mb 512] [--stale]
+#   python om_cache.py clear
+
+import os, json, time, argparse
+from om_normalizer_basic import NORMALIZER_VERSION
+
+ROOT = os.getcwd()
+CACHE_DIR = os.path.join(ROOT, r"Cache\OM")
+DEFAULT_MAX_MB = int(os.getenv("OM_CACHE_MAX_MB", "512"))
+
+class ResultCache:
+    def __init__(self, root=CACHE_DIR, version=NORMALIZER_VERSION, max_mb=DEFAULT_MAX_MB):
+        self.root = root
+        self.version = version
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha):
+        return os.path.join(self.root, sha[:2], f"{sha}-{self.version}.json")
+
+    def get(self, sha):
+        path = self._path(sha)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(path)   # LRU: mtime = last use
+        except OSError:
+            pass
+        return value
+
+    def put(self, sha, value):
+        path = self._path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+
+    def entries(self):
+        """[(path, sha, version, size, last_used)] for every cached result."""
+        out = []
+        for sub in os.listdir(self.root):
+            d = os.path.join(self.root, sub)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                if not name.endswith(".json"):
+                    continue
+                sha, _, version = name[:-5].partition("-")
+                st = os.stat(os.path.join(d, name))
+                out.append((os.path.join(d, name), sha, version, st.st_size, st.st_mtime))
+        return out
+
+    def prune(self, max_bytes=None, stale=False):
+        """Evict least recently used entries until the cache fits in max_bytes.
+        With stale=True, first drop entries written by other normalizer versions.
+        Returns (removed_count, removed_bytes)."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda e: e[4])
+        total = sum(e[3] for e in entries)
+        removed, freed = 0, 0
+        for path, _, version, size, _ in entries:
+            if total <= max_bytes and not (stale and version != self.version):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["stats", "list", "prune", "clear"])
+    ap.add_argument("--root", default=CACHE_DIR)
+    ap.add_argument("--max-mb", type=float, default=DEFAULT_MAX_MB)
+    ap.add_argument("--stale", action="store_true", help="only list / also prune entries from other normalizer versions")
+    args = ap.parse_args()
+
+    cache = ResultCache(args.root, max_mb=args.max_mb)
+    entries = cache.entries()
+    if args.cmd == "stats":
+        cur = [e for e in entries if e[2] == cache.version]
+        print(f"Cache: {cache.root}")
+        print(f"  entries: {len(entries)} ({len(cur)} current, {len(entries) - len(cur)} stale)")
+        print(f"  size:    {sum(e[3] for e in entries) / 1048576:.1f} MB (cap {args.max_mb:g} MB)")
+        print(f"  version: {cache.version}")
+    elif args.cmd == "list":
+        for path, sha, version, size, used in sorted(entries, key=lambda e: e[4], reverse=True):
+            if args.stale and version == cache.version:
+                continue
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  {size:>9,}  {version:<10} {sha}")
+    elif args.cmd == "prune":
+        n, freed = cache.prune(stale=args.stale)
+        print(f"Pruned {n} entries ({freed / 1048576:.1f} MB)")
+    else:
+        n, freed = cache.prune(max_bytes=0)
+        print(f"Cleared {n} entries ({freed / 1048576:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
-import os, re, json, argparse, pandas as pd, pdfplumber, fitz
+import os, io, re, json, bisect, argparse, pdfplumber, fitz
+import om_rentroll
+
+# Bump whenever a change here alters extraction output; it is part of the om_cache key.
+NORMALIZER_VERSION = "basic-3"
 
 def find_first_page(pdf, keyword):
     for i, p in enumerate(pdf.pages):
@@ -6,65 +10,152 @@ def find_first_page(pdf, keyword):
         if keyword.lower() in t: return i
     return None
 
-def grab_tables(pdf, max_pages=None):
-    rows = []
-    for p in pdf.pages[:max_pages or len(pdf.pages)]:
-        for tbl in (p.extract_tables() or []):
-            if not tbl or len(tbl) < 2: continue
-            header = [(h or "").strip().lower() for h in tbl[0]]
-            if any(k in " ".join(header) for k in ["tenant", "suite", "sf", "rent", "expiration", "led"]):
-                for r in tbl[1:]:
-                    rows.append([(c or "").strip() for c in r])
-    return rows[:200]
-
-def parse_prop_metrics(doc):
-    labels = ["total property gla", "total property occupancy", "shop sales psf", "occupancy cost",
-              "year built", "acreage", "parking", "placer.ai"]
+class PageText:
+    """Per-page fitz text, extracted once and shared by every parser."""
+    def __init__(self, doc):
+        self.doc = doc
+        self._pages = [None] * len(doc)
+        self._joined = None
+
+    def __len__(self):
+        return len(self._pages)
+
+    def page(self, i):
+        if self._pages[i] is None:
+            self._pages[i] = self.doc[i].get_text()
+        return self._pages[i]
+
+    @property
+    def text(self):
+        if self._joined is None:
+            self._joined = " ".join(self.page(i) for i in range(len(self)))
+        return self._joined
+
+# Cheap fitz-text test for pages worth running pdfplumber's table finder on
+RENTROLL_HINT = re.compile(r"\b(tenant|suite|sf|sq\.?\s?ft|square feet|expir\w*|lease)\b", re.I)
+
+def rentroll_pages(pages, min_hits=2):
     out = []
-    text = " ".join(page.get_text() for page in doc).lower()
-    for lab in labels:
-        m = re.search(rf"{re.escape(lab)}\s*[:=]?\s*([^\n;]+)", text, re.I)
-        if m: out.append(m.group(0))
+    for i in range(len(pages)):
+        hits = {m.group(1).lower() for m in RENTROLL_HINT.finditer(pages.page(i))}
+        if len(hits) >= min_hits:
+            out.append(i)
     return out
 
-def extract_mtm(doc):
-    text = " ".join(page.get_text() for page in doc).replace("\n", " ")
-    m = re.search(r"\$?(\d+\.?\d*)\s*psf.*?\$?(\d+\.?\d*)\s*psf.*?(\d+\.?\d*)\s*%", text, re.I)
-    if m:
-        return {"InPlace_Avg_PSF": m.group(1), "Market_Avg_PSF": m.group(2), "Avg_MTM_Pct": m.group(3)}
+def grab_tables(pdf, page_idx=None, max_pages=None, max_rows=200):
+    """Rent roll-looking tables as {"page", "header", "rows"} (header kept for om_rentroll)."""
+    tables, n = [], 0
+    if page_idx is None:
+        page_idx = range(max_pages or len(pdf.pages))
+    for i in page_idx:
+        p = pdf.pages[i]
+        for tbl in (p.extract_tables() or []):
+            if not tbl or len(tbl) < 2: continue
+            header = [(h or "").strip() for h in tbl[0]]
+            if any(k in " ".join(header).lower() for k in ["tenant", "suite", "sf", "rent", "expiration", "led"]):
+                rows = [[(c or "").strip() for c in r] for r in tbl[1:max_rows - n + 1]]
+                tables.append({"page": i, "header": header, "rows": rows})
+                n += len(rows)
+                if n >= max_rows:
+                    return tables
+    return tables
+
+# Precompiled single-pass scanners. Labels are found in one sweep over the text
+# (zero-width lookahead so overlapping labels such as "total property occupancy"
+# / "occupancy cost" are all seen); the value tail is matched at each hit.
+PROP_LABELS = ["total property gla", "total property occupancy", "shop sales psf", "occupancy cost",
+               "year built", "acreage", "parking", "placer.ai"]
+PROP_LABEL_RE = re.compile("(?=(" + "|".join(re.escape(l) for l in PROP_LABELS) + "))")
+PROP_TAIL_RE = re.compile(r"\s*[:=]?\s*([^\n;]+)")
+
+# MTM headline: "$x psf ... $y psf ... z%", each step bounded to MTM_WINDOW chars
+PSF_RE = re.compile(r"\$?(\d+\.?\d*)\s*psf", re.I)
+PCT_RE = re.compile(r"(\d+\.?\d*)\s*%")
+MTM_WINDOW = 400
+
+def parse_prop_metrics(pages):
+    text = pages.text.lower()
+    found = {}
+    for m in PROP_LABEL_RE.finditer(text):
+        lab = m.group(1)
+        if lab in found:
+            continue
+        t = PROP_TAIL_RE.match(text, m.start() + len(lab))
+        if t:
+            found[lab] = text[m.start():t.end()]
+            if len(found) == len(PROP_LABELS): break
+    return [found[lab] for lab in PROP_LABELS if lab in found]
+
+def extract_mtm(pages):
+    text = pages.text.replace("\n", " ")
+    psf = list(PSF_RE.finditer(text))
+    if len(psf) < 2:
+        return {}
+    pct = list(PCT_RE.finditer(text))
+    pct_starts = [m.start() for m in pct]
+    for a, b in zip(psf, psf[1:]):
+        if b.start() - a.end() > MTM_WINDOW:
+            continue
+        j = bisect.bisect_left(pct_starts, b.end())
+        if j < len(pct) and pct[j].end() <= b.end() + MTM_WINDOW:
+            return {"InPlace_Avg_PSF": a.group(1), "Market_Avg_PSF": b.group(1), "Avg_MTM_Pct": pct[j].group(1)}
     return {}
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--pdf", required=True)
-    ap.add_argument("--bucket", default="OM_INTAKE")
-    ap.add_argument("--outroot", default=r"Outputs\Normalized")
-    args = ap.parse_args()
+def extract(pdf_path):
+    """Run every parser over one PDF. Returns the raw extraction (what om_cache stores)."""
+    # Read the file once; fitz text feeds every parser, pdfplumber only sees rent roll candidates
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        pages = PageText(doc)
+        mtm_head = extract_mtm(pages)
+        prop_hint = parse_prop_metrics(pages)
+        rr_idx = rentroll_pages(pages)
+    rr_tables = []
+    if rr_idx:
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            rr_tables = grab_tables(pdf, rr_idx)
+    return {"rentroll_tables": rr_tables, "mtm_headline": mtm_head, "property_metrics_hints": prop_hint}
 
-    outdir = os.path.join(args.outroot, args.bucket)
+def normalize(pdf_path, bucket="OM_INTAKE", outroot=r"Outputs\Normalized", extracted=None):
+    """Write the normalized JSON (+ typed rent roll table) for one PDF, parsing it unless
+    `extracted` (e.g. from om_cache) is given. Returns (payload, json_path)."""
+    outdir = os.path.join(outroot, bucket)
     os.makedirs(outdir, exist_ok=True)
-    base = os.path.splitext(os.path.basename(args.pdf))[0].replace(" ", "_")
+    base = os.path.splitext(os.path.basename(pdf_path))[0].replace(" ", "_")
 
-    with pdfplumber.open(args.pdf) as pdf, fitz.open(args.pdf) as doc:
-        rr_rows = grab_tables(pdf)
-        mtm_head = extract_mtm(doc)
-        prop_hint = parse_prop_metrics(doc)
+    if extracted is None:
+        extracted = extract(pdf_path)
+    mtm_head = extracted["mtm_headline"]
+    prop_hint = extracted["property_metrics_hints"]
 
-    rr_csv = None
-    if rr_rows:
-        rr_csv = f"{base}_rentroll_raw.csv"
-        pd.DataFrame(rr_rows).to_csv(os.path.join(outdir, rr_csv), index=False, header=False)
+    rr_table, rr_metrics = None, {}
+    rr = om_rentroll.normalize_tables(extracted["rentroll_tables"])
+    if not rr.empty:
+        rr_table = om_rentroll.write_table(rr, os.path.join(outdir, f"{base}_rentroll"))
+        rr_metrics = om_rentroll.rentroll_metrics(rr)
 
     payload = {
-        "source_pdf": os.path.abspath(args.pdf),
-        "bucket": args.bucket,
-        "rentroll_csv": rr_csv,
+        "source_pdf": os.path.abspath(pdf_path),
+        "bucket": bucket,
+        "rentroll_table": rr_table,
+        "rentroll_metrics": rr_metrics,
         "mtm_headline": mtm_head,
         "property_metrics_hints": prop_hint[:20]
     }
-    with open(os.path.join(outdir, f"{base}.json"), "w", encoding="utf-8") as f:
+    out_json = os.path.join(outdir, f"{base}.json")
+    with open(out_json, "w", encoding="utf-8") as f:
         json.dump(payload, f, indent=2)
-    print(f"Normalized -> {os.path.join(outdir, f'{base}.json')}")
+    print(f"Normalized -> {out_json}")
+    return payload, out_json
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pdf", required=True)
+    ap.add_argument("--bucket", default="OM_INTAKE")
+    ap.add_argument("--outroot", default=r"Outputs\Normalized")
+    args = ap.parse_args()
+    normalize(args.pdf, args.bucket, args.outroot)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
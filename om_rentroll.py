@@ -0,0 +1,186 @@
+# om_rentroll.py
+# Rent roll stage: raw pdfplumber tables (header + rows, from om_normalizer_basic.extract)
+# -> one typed tenant table in a canonical schema, plus metrics computed from it.
+# - Headers mapped by keyword to: tenant, suite, sf, rent_psf, market_psf, annual_rent,
+#   lease_start, expiration (first matching header per column wins; the rest are dropped)
+# - Currency / numbers, percents and dates parsed with vectorized pandas string ops
+# - Monthly rent / monthly PSF columns annualized (x12); rows with a PSF outside
+#   PSF_RANGE dropped from the rent averages
+# - Metrics: total / leased SF, occupancy %, SF-weighted in-place and market rent PSF
+#   and the mark-to-market % between them; checked_metrics() keeps only plausible ones
+# - Table written as Parquet (pyarrow or fastparquet), CSV when neither is installed
+#
+#   python om_rentroll.py --norm Outputs\Normalized\OM_INTAKE\deal.json   (print the table + metrics)
+
+import os, re, json, argparse, pandas as pd
+
+COLUMNS = ["tenant", "suite", "sf", "rent_psf", "market_psf", "annual_rent", "lease_start", "expiration"]
+MONTHLY = ["rent_psf_mo", "monthly_rent"]        # read from the PDF, annualized into rent_psf / annual_rent
+
+PSF_RANGE = (0.5, 500.0)        # annual $/SF
+OCC_RANGE = (0.0, 100.0)
+MTM_RANGE = (-75.0, 200.0)
+
+_PSF = r"psf|p\.s\.f|/\s*sf\b|per\s*(?:sf|sq)|/\s*sq\.?\s*ft|/\s*rsf"
+_MONTH = r"month|mthly|\bmo\b|/\s*mo"
+
+# Checked in this order for each header; "market rent psf" must reach market_psf before
+# rent_psf, monthly figures must not land in the annual columns, and "rent/sf" must not
+# be taken for an area column.
+HEADER_RULES = [
+    ("market_psf",  re.compile(r"market")),
+    ("rent_psf_mo", re.compile(rf"(?=.*(?:{_MONTH}))(?=.*(?:{_PSF}))")),
+    ("monthly_rent", re.compile(rf"(?=.*rent)(?=.*(?:{_MONTH}))")),
+    ("rent_psf",    re.compile(_PSF)),
+    ("expiration",  re.compile(r"expir|\bexp\b|\bled\b|end\s*date|lease\s*end|term\s*end")),
+    ("lease_start", re.compile(r"commence|start|begin|\blcd\b")),
+    ("sf",          re.compile(r"\bsf\b|sq\.?\s*f|square|\bgla\b|\brsf\b|\bnra\b|\barea\b|\bsize\b")),
+    ("annual_rent", re.compile(r"annual|base\s*rent|\brent\b")),
+    ("suite",       re.compile(r"suite|\bunit\b|\bspace\b|\bste\b|#")),
+    ("tenant",      re.compile(r"tenant|lessee|occupant|\bname\b")),
+]
+VACANT_RE = r"(?i)\b(?:vacant|available|vacancy)\b"
+# A whole-cell summary label ("Total", "Subtotal:", "Total Occupied SF", ...); a tenant
+# that merely starts with the word ("Total Wine & More") does not match
+TOTAL_RE = (r"(?i)^\s*(?:sub\s*-?\s*total|grand\s+total|total|occupied)"
+            r"(?:\s+(?:sf|rsf|gla|leased|occupied|vacant|available|area|rent\s*roll))*[\s:]*$")
+NUM_RE = r"(-?\d+(?:\.\d+)?)"
+
+def map_header(header):
+    """{canonical column: index in header}."""
+    out = {}
+    for idx, h in enumerate(header):
+        h = re.sub(r"\s+", " ", (h or "").lower())
+        for col, rx in HEADER_RULES:
+            if col not in out and rx.search(h):
+                out[col] = idx
+                break
+    return out
+
+def to_number(s):
+    """'$1,234.50' / '(12.0)' / '12%' -> float; anything else -> NaN (vectorized)."""
+    s = s.astype("string").str.strip()
+    neg = s.str.startswith("(") & s.str.endswith(")")
+    num = pd.to_numeric(s.str.replace(r"[$,\s]", "", regex=True).str.extract(NUM_RE, expand=False), errors="coerce")
+    return num.where(~neg.fillna(False), -num)
+
+def to_date(s):
+    s = s.astype("string").str.strip().replace("", pd.NA)
+    return pd.to_datetime(s, errors="coerce", format="mixed")
+
+def table_frame(tbl):
+    """One raw table {"header": [...], "rows": [[...]]} -> canonical string frame (or None)."""
+    cols = map_header(tbl.get("header") or [])
+    if not {"sf", "rent_psf", "rent_psf_mo"} & set(cols):
+        return None
+    rows = tbl.get("rows") or []
+    width = len(tbl["header"])
+    raw = pd.DataFrame([(r + [""] * width)[:width] for r in rows])
+    if raw.empty:
+        return None
+    df = pd.DataFrame({c: raw[cols[c]] if c in cols else "" for c in COLUMNS + MONTHLY})
+    df["page"] = tbl.get("page")
+    return df
+
+def normalize_tables(tables):
+    """Raw tables -> typed tenant table (one row per suite; totals/blank rows dropped)."""
+    frames = [f for f in (table_frame(t) for t in tables or []) if f is not None]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS + ["vacant", "page"])
+    df = pd.concat(frames, ignore_index=True)
+    tenant = df["tenant"].astype("string").str.strip()
+    suite = df["suite"].astype("string").str.strip()
+    # Summary lines ("Total", "Occupied", ...) would double count the SF; the label sits
+    # in the tenant or the suite cell (often Suite, with the tenant cell blank)
+    total = tenant.str.contains(TOTAL_RE, na=False) | suite.str.contains(TOTAL_RE, na=False)
+    out = pd.DataFrame({
+        "tenant": tenant,
+        "suite": suite,
+        "sf": to_number(df["sf"]),
+        "rent_psf": to_number(df["rent_psf"]).fillna(to_number(df["rent_psf_mo"]) * 12),
+        "market_psf": to_number(df["market_psf"]),
+        "annual_rent": to_number(df["annual_rent"]).fillna(to_number(df["monthly_rent"]) * 12),
+        "lease_start": to_date(df["lease_start"]),
+        "expiration": to_date(df["expiration"]),
+        "page": pd.array(df["page"], dtype="Int16"),
+    })
+    # Only an explicit keyword marks a suite vacant; a blank tenant cell is not enough
+    out["vacant"] = tenant.str.contains(VACANT_RE, na=False) | suite.str.contains(VACANT_RE, na=False)
+    # Rent given only as an annual amount: derive PSF
+    derive = out["rent_psf"].isna() & out["annual_rent"].notna() & (out["sf"] > 0)
+    out.loc[derive, "rent_psf"] = out.loc[derive, "annual_rent"] / out.loc[derive, "sf"]
+    keep = ~total & (out["sf"].notna() | out["rent_psf"].notna())
+    return out[keep].reset_index(drop=True)[COLUMNS + ["vacant", "page"]]
+
+def _in_range(v, bounds):
+    return v.where((v >= bounds[0]) & (v <= bounds[1]))
+
+def _wavg(v, w):
+    m = v.notna() & w.notna() & (w > 0)
+    return float((v[m] * w[m]).sum() / w[m].sum()) if m.any() else None
+
+def rentroll_metrics(df):
+    """Occupancy and in-place vs market rent straight from the tenant table."""
+    if df is None or df.empty:
+        return {}
+    sf = df["sf"]
+    leased = ~df["vacant"]
+    total_sf = float(sf.sum()) if sf.notna().any() else None
+    leased_sf = float(sf[leased].sum()) if sf.notna().any() else None
+    inplace = _wavg(_in_range(df.loc[leased, "rent_psf"].astype(float), PSF_RANGE), sf[leased])
+    market = _wavg(_in_range(df.loc[leased, "market_psf"].astype(float), PSF_RANGE), sf[leased])
+    out = {
+        "tenants": int(leased.sum()),
+        "total_sf": total_sf,
+        "leased_sf": leased_sf,
+        "occupancy_pct": round(leased_sf / total_sf * 100, 2) if total_sf else None,
+        "inplace_psf": round(inplace, 2) if inplace is not None else None,
+        "market_psf": round(market, 2) if market is not None else None,
+        "mtm_pct": round((market / inplace - 1) * 100, 2) if inplace and market is not None else None,
+    }
+    return {k: v for k, v in out.items() if v is not None}
+
+def checked_metrics(m):
+    """Rent roll metrics that pass the sanity bounds; the in-place / market / MTM trio is
+    dropped together when any of them is off, so callers fall back to the headline."""
+    m = dict(m or {})
+    ok = lambda k, r: m.get(k) is None or r[0] <= m[k] <= r[1]
+    if not ok("occupancy_pct", OCC_RANGE):
+        m.pop("occupancy_pct")
+    if not (ok("inplace_psf", PSF_RANGE) and ok("market_psf", PSF_RANGE) and ok("mtm_pct", MTM_RANGE)):
+        for k in ("inplace_psf", "market_psf", "mtm_pct"):
+            m.pop(k, None)
+    return m
+
+def write_table(df, out_base):
+    """Parquet when an engine is installed, else CSV. Returns the file name written."""
+    try:
+        path = out_base + ".parquet"
+        df.to_parquet(path, index=False)
+    except ImportError:
+        path = out_base + ".csv"
+        df.to_csv(path, index=False)
+    return os.path.basename(path)
+
+def read_table(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=["lease_start", "expiration"])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--norm", required=True)                  # path to normalized JSON
+    args = ap.parse_args()
+
+    with open(args.norm, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if not meta.get("rentroll_table"):
+        print("No rent roll table in this payload")
+        return
+    df = read_table(os.path.join(os.path.dirname(args.norm), meta["rentroll_table"]))
+    with pd.option_context("display.width", 160, "display.max_rows", 60):
+        print(df)
+    print(json.dumps(meta.get("rentroll_metrics") or rentroll_metrics(df), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# om_state.py
+# Embedded SQLite store for om_agent's processed state (replaces processed_files.json).
+# - files:  one row per PDF hash; done=1 once every stage has run
+# - stages: per-file stage status (running/done/failed) with timestamps and durations
+# - stat:   path -> (size, mtime_ns, file id) -> hash, so unchanged inputs are not re-read
+# WAL journal + one short transaction per update: O(1) writes, and a run that dies
+# mid-file leaves the finished stages recorded for the next run to resume from.
+#
+#   python om_state.py            (summary)
+#   python om_state.py --pending  (files with unfinished stages)
+
+import os, json, sqlite3, hashlib, argparse
+from datetime import datetime
+
+ROOT = os.getcwd()
+LOGS_DIR = os.path.join(ROOT, "Logs")
+STATE_DB = os.path.join(LOGS_DIR, "om_state.db")
+LEGACY_JSON = os.path.join(LOGS_DIR, "processed_files.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    sha          TEXT PRIMARY KEY,
+    name         TEXT,
+    done         INTEGER NOT NULL DEFAULT 0,
+    processed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    sha         TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    started_at  TEXT,
+    finished_at TEXT,
+    secs        REAL,
+    error       TEXT,
+    PRIMARY KEY (sha, stage)
+);
+CREATE TABLE IF NOT EXISTS stat (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    file_id  INTEGER NOT NULL,
+    sha      TEXT NOT NULL
+);
+"""
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024*1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class StateStore:
+    def __init__(self, path=STATE_DB, legacy_json=LEGACY_JSON):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        if legacy_json and os.path.exists(legacy_json):
+            self._import_json(legacy_json)
+
+    def close(self):
+        self.db.close()
+
+    def _import_json(self, path):
+        """One-time migration of processed_files.json (v1 list or v2 dict)."""
+        with open(path, "r", encoding="utf-8") as f:
+            cur = json.load(f)
+        files = {h: {"done": True, "stages": {}} for h in cur.get("processed", [])}
+        files.update(cur.get("files", {}))
+        with self.db:
+            self.db.execute("BEGIN")
+            for sha, rec in files.items():
+                self.db.execute("INSERT OR IGNORE INTO files (sha, name, done, processed_at) VALUES (?, ?, ?, ?)",
+                                (sha, rec.get("name"), int(bool(rec.get("done"))), rec.get("processed_at")))
+                for stage, info in (rec.get("stages") or {}).items():
+                    self.db.execute("INSERT OR IGNORE INTO stages (sha, stage, status, finished_at, secs) "
+                                    "VALUES (?, ?, 'done', ?, ?)", (sha, stage, info.get("at"), info.get("secs")))
+            for p, ent in (cur.get("stat") or {}).items():
+                size, mtime_ns, file_id = ent["sig"]
+                self.db.execute("INSERT OR IGNORE INTO stat VALUES (?, ?, ?, ?, ?)", (p, size, mtime_ns, file_id, ent["hash"]))
+        os.replace(path, path + ".migrated")
+        print(f"State: imported {len(files)} files from {os.path.basename(path)}")
+
+    # ---- files ----
+    def is_processed(self, sha):
+        row = self.db.execute("SELECT done FROM files WHERE sha = ?", (sha,)).fetchone()
+        return bool(row and row[0])
+
+    def processed_hashes(self):
+        return {r[0] for r in self.db.execute("SELECT sha FROM files WHERE done = 1")}
+
+    def mark_processed(self, sha, name):
+        self.db.execute("INSERT INTO files (sha, name, done, processed_at) VALUES (?, ?, 1, ?) "
+                        "ON CONFLICT(sha) DO UPDATE SET name = excluded.name, done = 1, processed_at = excluded.processed_at",
+                        (sha, name, _now()))
+
+    # ---- stages ----
+    def stages_done(self, sha):
+        return {r[0] for r in self.db.execute("SELECT stage FROM stages WHERE sha = ? AND status = 'done'", (sha,))}
+
+    def start_stage(self, sha, name, stage):
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute("INSERT INTO files (sha, name) VALUES (?, ?) ON CONFLICT(sha) DO UPDATE SET name = excluded.name",
+                            (sha, name))
+            self.db.execute("INSERT OR REPLACE INTO stages (sha, stage, status, started_at) VALUES (?, ?, 'running', ?)",
+                            (sha, stage, _now()))
+
+    def finish_stage(self, sha, stage, secs=None, error=None):
+        status = "failed" if error else "done"
+        self.db.execute("UPDATE stages SET status = ?, finished_at = ?, secs = ?, error = ? WHERE sha = ? AND stage = ?",
+                        (status, _now(), secs, error, sha, stage))
+
+    def reset_stages(self, sha):
+        self.db.execute("DELETE FROM stages WHERE sha = ?", (sha,))
+
+    # ---- stat cache ----
+    def cached_hash(self, path, verify=False):
+        """SHA-256 of path, reusing the stored hash while size/mtime/file id are unchanged."""
+        st = os.stat(path)
+        sig = (st.st_size, st.st_mtime_ns, st.st_ino)
+        row = self.db.execute("SELECT size, mtime_ns, file_id, sha FROM stat WHERE path = ?", (path,)).fetchone()
+        if row and tuple(row[:3]) == sig and not verify:
+            return row[3]
+        h = file_hash(path)
+        self.db.execute("INSERT OR REPLACE INTO stat VALUES (?, ?, ?, ?, ?)", (path, *sig, h))
+        return h
+
+    def prune_stat(self, present, under):
+        """Drop stat rows for files under `under` that are no longer present."""
+        rows = self.db.execute("SELECT path FROM stat").fetchall()
+        gone = [(p,) for (p,) in rows if p.startswith(under) and p not in present]
+        if gone:
+            with self.db:
+                self.db.execute("BEGIN")
+                self.db.executemany("DELETE FROM stat WHERE path = ?", gone)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=STATE_DB)
+    ap.add_argument("--pending", action="store_true", help="list files with unfinished stages")
+    args = ap.parse_args()
+
+    st = StateStore(args.db, legacy_json=None)
+    if args.pending:
+        q = ("SELECT f.name, s.stage, s.status, s.started_at FROM stages s JOIN files f ON f.sha = s.sha "
+             "WHERE f.done = 0 ORDER BY s.started_at")
+        for name, stage, status, started in st.db.execute(q):
+            print(f"{started or '':<20} {status:<8} {stage:<11} {name}")
+        return
+    done = st.db.execute("SELECT COUNT(*) FROM files WHERE done = 1").fetchone()[0]
+    pending = st.db.execute("SELECT COUNT(*) FROM files WHERE done = 0").fetchone()[0]
+    print(f"State: {args.db}")
+    print(f"  processed: {done}   unfinished: {pending}")
+    for stage, n, avg in st.db.execute("SELECT stage, COUNT(*), AVG(secs) FROM stages WHERE status = 'done' GROUP BY stage"):
+        print(f"  {stage:<11} {n:>6}  avg {avg or 0:.2f}s")
+
+if __name__ == "__main__":
+    main()
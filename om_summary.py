@@ -1,24 +1,149 @@
-import os, json, argparse, pandas as pd
+# om_summary.py
+# Per-OM summary CSV, plus one portfolio table across every OM (Outputs\portfolio.db,
+# keyed by source PDF hash). summarize() upserts the OM's metrics row and
+# upsert_label() its current label, so the table is updated in place rather than
+# rebuilt from hundreds of _summary.csv files; sorted/filtered exports run off indexes.
+#
+#   python om_summary.py --norm Outputs\Normalized\OM_INTAKE\deal.json
+#   python om_summary.py --build                 (backfill from every normalized payload + labels log)
+#   python om_summary.py --list --sort mtm_pct --label Green Yellow --min-occ 90 [--export deals.csv]
+import os, json, sqlite3, argparse, pandas as pd
+import om_rentroll
+from datetime import datetime
+
+PORTFOLIO_DB=r"Outputs\portfolio.db"
+PORTFOLIO_FIELDS=["sha","file","norm_json","bucket","occupancy_pct","inplace_psf","market_psf","mtm_pct",
+                  "total_sf","tenants","label","reasons","summarized_at","labeled_at"]
+SORT_KEYS=["mtm_pct","occupancy_pct","inplace_psf","market_psf","total_sf","label","file","summarized_at"]
 
 def percentify(x):
     try:
-        s=str(x).replace("%","").strip()
+        s=str(x).replace("%","").replace(",","").strip()
         return float(s) if s else None
     except: return None
 
-def main():
-    ap=argparse.ArgumentParser()
-    ap.add_argument("--bucket", default="OM_INTAKE")
-    ap.add_argument("--norm", required=True)
-    ap.add_argument("--outdir", default=r"Outputs\Scorecards")
-    args=ap.parse_args()
+def read_property_metrics(meta, norm_path):
+    """The OKC plugin's property metrics CSV (read once per summary), or None."""
+    pm_csv=meta.get("property_metrics_csv")
+    if not pm_csv: return None
+    pm_path=os.path.join(os.path.dirname(norm_path), pm_csv)
+    if not os.path.exists(pm_path): return None
+    return pd.read_csv(pm_path)
 
-    with open(args.norm,"r",encoding="utf-8") as f: meta=json.load(f)
-    outdir=os.path.join(args.outdir, args.bucket); os.makedirs(outdir, exist_ok=True)
+def _pm_row(pm, metric):
+    return pm.loc[pm["Metric"].str.contains(metric, na=False)] if pm is not None else pd.DataFrame()
+
+def portfolio_metrics(meta, pm=None):
+    """Portfolio columns for one OM: rent roll table first (when within bounds), then
+    headline MTM / property metrics."""
+    rr=om_rentroll.checked_metrics(meta.get("rentroll_metrics"))
+    mtm=meta.get("mtm_headline") or meta.get("mtm_head") or {}
+    out={
+        "occupancy_pct": rr.get("occupancy_pct"),
+        "inplace_psf": rr.get("inplace_psf", percentify(mtm.get("InPlace_Avg_PSF"))),
+        "market_psf": rr.get("market_psf", percentify(mtm.get("Market_Avg_PSF"))),
+        "mtm_pct": rr.get("mtm_pct", percentify(mtm.get("Avg_MTM_Pct"))),
+        "total_sf": rr.get("total_sf"),
+        "tenants": rr.get("tenants"),
+    }
+    occ=_pm_row(pm, "Total Property Occupancy")
+    if out["occupancy_pct"] is None and not occ.empty:
+        out["occupancy_pct"]=next((v for v in map(percentify, occ.iloc[0,1:5]) if v is not None), None)
+    return out
+
+# ---------- Portfolio table ----------
+def open_portfolio(path=PORTFOLIO_DB):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db=sqlite3.connect(path, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS portfolio (
+            sha TEXT PRIMARY KEY, file TEXT, norm_json TEXT, bucket TEXT,
+            occupancy_pct REAL, inplace_psf REAL, market_psf REAL, mtm_pct REAL,
+            total_sf REAL, tenants INTEGER, label TEXT, reasons TEXT,
+            summarized_at TEXT, labeled_at TEXT);
+        CREATE INDEX IF NOT EXISTS portfolio_mtm ON portfolio (mtm_pct);
+        CREATE INDEX IF NOT EXISTS portfolio_occ ON portfolio (occupancy_pct);
+        CREATE INDEX IF NOT EXISTS portfolio_label ON portfolio (label, mtm_pct);
+    """)
+    return db
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def upsert_summaries(db, rows):
+    """rows: dicts with sha, file, norm_json, bucket + portfolio_metrics(). Label columns are kept."""
+    cols=["sha","file","norm_json","bucket","occupancy_pct","inplace_psf","market_psf","mtm_pct","total_sf","tenants","summarized_at"]
+    now=_now()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany(f"INSERT INTO portfolio ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                       f"ON CONFLICT(sha) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in cols[1:])}",
+                       [[r.get("summarized_at") or now if c=="summarized_at" else r.get(c) for c in cols] for r in rows])
+
+def upsert_labels(db, rows):
+    """rows: dicts with sha, file, label, reasons (a color_labeler row plus its sha)."""
+    now=_now()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany("INSERT INTO portfolio (sha, file, norm_json, label, reasons, labeled_at) VALUES (?, ?, ?, ?, ?, ?) "
+                       "ON CONFLICT(sha) DO UPDATE SET label=excluded.label, reasons=excluded.reasons, labeled_at=excluded.labeled_at",
+                       [(r["sha"], r.get("file"), r.get("norm_json"), r.get("label"), r.get("reasons"), r.get("labeled_at") or now)
+                        for r in rows])
+
+def upsert_label(sha, row, path=PORTFOLIO_DB):
+    """Record the current label for one OM (called by om_agent after labeling)."""
+    db=open_portfolio(path)
+    try: upsert_labels(db, [dict(row, sha=sha)])
+    finally: db.close()
+
+def query_portfolio(db, sort="mtm_pct", desc=True, labels=None, min_mtm=None, max_mtm=None,
+                    min_occ=None, max_occ=None, limit=None):
+    """Filtered, sorted portfolio rows as a DataFrame (missing values sort last)."""
+    if sort not in SORT_KEYS: raise ValueError(f"sort must be one of {SORT_KEYS}")
+    where, params=[], []
+    if labels:
+        where.append(f"label IN ({', '.join('?' * len(labels))})"); params+=list(labels)
+    for col, op, v in (("mtm_pct",">=",min_mtm),("mtm_pct","<=",max_mtm),("occupancy_pct",">=",min_occ),("occupancy_pct","<=",max_occ)):
+        if v is not None:
+            where.append(f"{col} {op} ?"); params.append(v)
+    q=(f"SELECT {', '.join(PORTFOLIO_FIELDS)} FROM portfolio" + (f" WHERE {' AND '.join(where)}" if where else "")
+       + f" ORDER BY {sort} IS NULL, {sort} {'DESC' if desc else 'ASC'}" + (f" LIMIT {int(limit)}" if limit else ""))
+    return pd.DataFrame(db.execute(q, params).fetchall(), columns=PORTFOLIO_FIELDS)
+
+def build_portfolio(normdir, labels_csv=r"Outputs\labels_log.csv", path=PORTFOLIO_DB, bucket="OM_INTAKE"):
+    """Backfill: upsert every normalized payload whose source PDF still exists, plus its latest label."""
+    from om_state import file_hash
+    from color_labeler import latest_labels
+    rows, hashes={}, {}
+    for name in sorted(os.listdir(normdir)) if os.path.isdir(normdir) else []:
+        if not name.endswith(".json"): continue
+        norm_path=os.path.join(normdir, name)
+        try:
+            with open(norm_path,"r",encoding="utf-8") as f: meta=json.load(f)
+        except (OSError, ValueError): continue
+        src=meta.get("source_pdf") if isinstance(meta, dict) else None
+        if not src or not os.path.exists(src): continue
+        sha=hashes.setdefault(src, file_hash(src))
+        rows[sha]=dict(portfolio_metrics(meta, read_property_metrics(meta, norm_path)),
+                       sha=sha, file=os.path.basename(src), norm_json=name, bucket=bucket)
+    latest=latest_labels(labels_csv) if labels_csv else {}
+    labeled=[dict(latest[r["file"]], sha=sha) for sha, r in rows.items() if r["file"] in latest]
+    db=open_portfolio(path)
+    try:
+        upsert_summaries(db, list(rows.values()))
+        upsert_labels(db, labeled)
+    finally: db.close()
+    print(f"Portfolio: {len(rows)} OMs upserted ({len(labeled)} with labels) -> {path}")
+
+# ---------- Per-OM summary ----------
+def summarize(meta, norm_path, bucket="OM_INTAKE", outdir=r"Outputs\Scorecards", sha=None, portfolio=None):
+    """Write the per-OM summary CSV for an already loaded normalized payload.
+    With sha and a portfolio DB path, also upserts the OM's row in the portfolio table."""
+    outdir=os.path.join(outdir, bucket); os.makedirs(outdir, exist_ok=True)
 
     rows=[["Source PDF", meta.get("source_pdf","")]]
-    mtm=meta.get("mtm_headline") or meta.get("mtm_headline".replace("headline","headline"))  # tolerant
-    if not mtm: mtm=meta.get("mtm_head")
+    mtm=meta.get("mtm_headline") or meta.get("mtm_head")
     if mtm:
         rows+=[
             ["Avg In-Place Rent PSF", mtm.get("InPlace_Avg_PSF")],
@@ -26,19 +151,82 @@ def main():
             ["Avg Mark-to-Market %", mtm.get("Avg_MTM_Pct")]
         ]
 
+    # Tenant-table metrics (om_rentroll) when the OM had a parseable rent roll
+    rr=meta.get("rentroll_metrics") or {}
+    if rr:
+        rows+=[
+            ["Rent Roll Tenants", rr.get("tenants")],
+            ["Rent Roll Leased / Total SF", f"{rr.get('leased_sf')} / {rr.get('total_sf')}"],
+            ["Rent Roll Occupancy %", rr.get("occupancy_pct")],
+            ["Rent Roll In-Place PSF", rr.get("inplace_psf")],
+            ["Rent Roll Market PSF", rr.get("market_psf")],
+            ["Rent Roll Mark-to-Market %", rr.get("mtm_pct")]
+        ]
+
     # If a property metrics CSV exists (from OKC plugin), include GLA/Occ
-    pm_csv=meta.get("property_metrics_csv")
-    if pm_csv:
-        pm_path=os.path.join(os.path.dirname(args.norm), pm_csv)
-        if os.path.exists(pm_path):
-            pm=pd.read_csv(pm_path)
-            gla=pm.loc[pm["Metric"].str.contains("Total Property GLA", na=False)]
-            occ=pm.loc[pm["Metric"].str.contains("Total Property Occupancy", na=False)]
-            if not gla.empty: rows.append(["GLA (Collection/CC/Triangle/NHP)", " / ".join(str(x) for x in gla.iloc[0,1:5])])
-            if not occ.empty: rows.append(["Occupancy (Collection/CC/Triangle/NHP)", " / ".join(str(x) for x in occ.iloc[0,1:5])])
-
-    out_csv=os.path.join(outdir, os.path.splitext(os.path.basename(args.norm))[0] + "_summary.csv")
+    pm=read_property_metrics(meta, norm_path)
+    gla=_pm_row(pm, "Total Property GLA")
+    occ=_pm_row(pm, "Total Property Occupancy")
+    if not gla.empty: rows.append(["GLA (Collection/CC/Triangle/NHP)", " / ".join(str(x) for x in gla.iloc[0,1:5])])
+    if not occ.empty: rows.append(["Occupancy (Collection/CC/Triangle/NHP)", " / ".join(str(x) for x in occ.iloc[0,1:5])])
+
+    out_csv=os.path.join(outdir, os.path.splitext(os.path.basename(norm_path))[0] + "_summary.csv")
     pd.DataFrame(rows, columns=["Metric","Value"]).to_csv(out_csv, index=False)
     print(f"Summary -> {out_csv}")
+
+    if sha and portfolio:
+        src=meta.get("source_pdf") or ""
+        db=open_portfolio(portfolio)
+        try:
+            upsert_summaries(db, [dict(portfolio_metrics(meta, pm), sha=sha, file=os.path.basename(src),
+                                       norm_json=os.path.basename(norm_path), bucket=bucket)])
+        finally: db.close()
+    return out_csv
+
+def main():
+    ap=argparse.ArgumentParser()
+    ap.add_argument("--bucket", default="OM_INTAKE")
+    ap.add_argument("--norm")
+    ap.add_argument("--outdir", default=r"Outputs\Scorecards")
+    ap.add_argument("--portfolio", default=PORTFOLIO_DB)
+    ap.add_argument("--build", action="store_true", help="upsert every payload in --normdir (and its latest label)")
+    ap.add_argument("--normdir", default=r"Outputs\Normalized\OM_INTAKE")
+    ap.add_argument("--labels_csv", default=r"Outputs\labels_log.csv")
+    ap.add_argument("--list", action="store_true", help="print / export the portfolio table")
+    ap.add_argument("--sort", default="mtm_pct", choices=SORT_KEYS)
+    ap.add_argument("--asc", action="store_true")
+    ap.add_argument("--label", nargs="+")
+    ap.add_argument("--min-mtm", type=float); ap.add_argument("--max-mtm", type=float)
+    ap.add_argument("--min-occ", type=float); ap.add_argument("--max-occ", type=float)
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--export", help="write the filtered table to this CSV")
+    args=ap.parse_args()
+
+    if args.build:
+        build_portfolio(args.normdir, args.labels_csv, args.portfolio, args.bucket)
+    if args.list or args.export:
+        db=open_portfolio(args.portfolio)
+        try:
+            df=query_portfolio(db, args.sort, not args.asc, args.label, args.min_mtm, args.max_mtm,
+                               args.min_occ, args.max_occ, args.limit)
+        finally: db.close()
+        if args.export:
+            df.to_csv(args.export, index=False)
+            print(f"Portfolio export ({len(df)} OMs) -> {args.export}")
+        else:
+            with pd.option_context("display.width", 160, "display.max_rows", 200):
+                print(df.drop(columns=["sha","norm_json","bucket","reasons","summarized_at","labeled_at"]).to_string(index=False))
+    if args.build or args.list or args.export:
+        return
+    if not args.norm:
+        ap.error("--norm is required")
+
+    with open(args.norm,"r",encoding="utf-8") as f: meta=json.load(f)
+    src=meta.get("source_pdf")
+    sha=None
+    if src and os.path.exists(src):
+        from om_state import file_hash
+        sha=file_hash(src)
+    summarize(meta, args.norm, args.bucket, args.outdir, sha, args.portfolio)
 if __name__=="__main__":
     main()
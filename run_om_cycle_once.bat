@@ -15,7 +15,7 @@ echo [07:10 PM CDT] Intake log (tail):
 powershell -NoP -C "(Get-Content '.\Logs\email_intake.log' -Tail 8 -ErrorAction SilentlyContinue)"
 
 echo [07:10 PM CDT] Queue size (gated links):
-if exist ".\Logs\gated_queue.json" (powershell -NoP -C "(gc '.\Logs\gated_queue.json'|Select-String '\"url\"').Count" ) else (echo 0 )
+python -u gated_queue.py stats
 
 echo [07:10 PM CDT] STEP 1.5: Prune queue...
 python -u queue_prune.py
@@ -33,7 +33,7 @@ echo [07:10 PM CDT] Agent log (tail):
 powershell -NoP -C "(Get-Content '.\Logs\agent.log' -Tail 8 -ErrorAction SilentlyContinue)"
 
 echo [07:10 PM CDT] Summary:
-powershell -NoP -C "if (Test-Path '.\Outputs\labels_log.csv') {(Import-Csv '.\Outputs\labels_log.csv'|Group-Object label|Select-Object Name,Count|Format-Table -AutoSize|Out-String).Trim()} else {Write-Output 'No labels_log.csv found'}"
+python -u color_labeler.py --summary
 
 echo [07:10 PM CDT] Done.
 
@@ -0,0 +1,12 @@
+@echo off
+setlocal
+
+cd /d "%~dp0"
+
+rem Long-running agent: processes what is already in Inputs, then every PDF that lands
+rem there (clicker downloads, manual drops) within seconds. Ctrl+C to stop.
+rem pip install watchdog for filesystem events; without it Inputs is polled every 2s.
+echo Agent watching Inputs (log: Logs\agent.log)...
+python -u om_agent.py --watch --workers 2 1>>".\Logs\agent.log" 2>&1
+
+endlocal
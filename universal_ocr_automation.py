@@ -1,42 +1,92 @@
 # universal_ocr_automation.py
 # Universal OCR-driven GUI automation for all broker platforms.
+# One browser window and one OCR engine serve every target: the first URL launches
+# Chrome, later ones are loaded into the same window. Targets come from the command
+# line or from the gated-link queue (--queue: claimed, then marked done/failed).
+#
+#   python universal_ocr_automation.py <url> [<url> ...]
+#   python universal_ocr_automation.py --queue [--limit 20]
 
 import sys
 import time
-import pyautogui
-from chrome_launcher_gui import launch_chrome, ocr_find_and_click, clear_download_tray
-
-# ---------- Argument Parsing ----------
-if len(sys.argv) < 2:
-    print("Usage: python universal_ocr_automation.py <target_url>")
-    sys.exit(1)
-
-TARGET_URL = sys.argv[1]
-
-# Define general-purpose OCR target words common across platforms
-PLATFORM_WORDS = [
-    # Login / Access
-    "Sign Up or Log In", "Log In", "Login", "Sign In",
-    # Common NDAs / confirmations
-    "I Agree", "Accept", "Continue", "Proceed",
-    # Common download buttons
-    "Download", "View OM", "View Offering", "Open Package", "Access Files"
+import argparse
+from chrome_launcher_gui import (OcrEngine, launch_chrome, navigate, clear_download_tray,
+                                 wait_for_screen_stable)
+
+# (name, target words, max_wait)
+STEPS = [
+    ("login", ["Sign Up or Log In", "Log In", "Login", "Sign In"], 40),   # trigger any login / access modal
+    ("nda", ["I Agree", "Accept", "Continue", "Proceed"], 20),           # NDA / confirmation
+    ("download", ["Download", "View OM", "View Offering", "Open Package", "Access Files"], 30),
 ]
 
 # ---------- Workflow ----------
-print(f"Starting OCR automation for {TARGET_URL} ...")
-launch_chrome(TARGET_URL)
-time.sleep(5)
+def run_target(url, engine):
+    """Run the login / NDA / download steps on the loaded page. Returns a result dict."""
+    res = {"url": url, "clicked": [], "download": None}
+    wait_for_screen_stable(max_wait=5, settle=0.5)
+
+    t_click = time.time()
+    for name, words, max_wait in STEPS:
+        if name == "download":
+            t_click = time.time()
+        if engine.find_and_click(words, max_wait=max_wait):
+            res["clicked"].append(name)
+
+    # Clear tray and finalize
+    res["download"] = clear_download_tray(since=t_click)
+    res["ok"] = "download" in res["clicked"]
+    return res
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("urls", nargs="*", help="target URLs, handled in order in one browser window")
+    ap.add_argument("--queue", action="store_true", help="drain pending links from the gated queue")
+    ap.add_argument("--limit", type=int, default=20, help="max queue links per run")
+    args = ap.parse_args()
 
-# Step 1: Trigger any login / access modal
-ocr_find_and_click(["Sign Up or Log In", "Log In", "Login", "Sign In"], max_wait=40)
+    queue = None
+    targets = list(args.urls)
+    if args.queue:
+        from gated_queue import GatedQueue
+        queue = GatedQueue()
+        targets += [it["url"] for it in queue.claim(args.limit)]
+    if not targets:
+        print("Usage: python universal_ocr_automation.py <target_url> [...] | --queue")
+        sys.exit(1)
 
-# Step 2: Handle NDA / confirmation
-ocr_find_and_click(["I Agree", "Accept", "Continue", "Proceed"], max_wait=20)
+    engine = OcrEngine()
+    results = []
+    launched = False
+    for i, url in enumerate(targets):
+        print(f"[{i + 1}/{len(targets)}] Starting OCR automation for {url} ...")
+        t0 = time.monotonic()
+        try:
+            if launched:
+                navigate(url)
+            else:
+                launch_chrome(url)
+                launched = True
+            res = run_target(url, engine)
+            res["secs"] = time.monotonic() - t0
+        except Exception as e:
+            res = {"url": url, "clicked": [], "download": None, "ok": False,
+                   "secs": time.monotonic() - t0, "error": str(e)}
+            print(f"  error: {e}")
+        results.append(res)
+        if queue is not None and url not in args.urls:
+            queue.mark(url, "done" if res["ok"] else "failed",
+                       None if res["ok"] else res.get("error") or f"clicked: {','.join(res['clicked']) or 'nothing'}")
 
-# Step 3: Handle main download / view action
-ocr_find_and_click(["Download", "View OM", "View Offering", "Access Files"], max_wait=30)
+    print(f"\n{'secs':>6}  {'ok':<3} {'clicked':<20} {'download':<28} url")
+    for r in results:
+        dl = (r["download"] or "-").replace("\\", "/").rsplit("/", 1)[-1]
+        print(f"{r['secs']:>6.1f}  {'yes' if r['ok'] else 'no':<3} {','.join(r['clicked']) or '-':<20} {dl[:28]:<28} {r['url']}")
+    print(f"Universal OCR automation complete: {sum(r['ok'] for r in results)}/{len(results)} targets, "
+          f"{sum(r['secs'] for r in results):.0f}s, OCR calls {engine.stats['ocr_calls']} "
+          f"(skipped {engine.stats['skipped']} unchanged frames).")
+    if queue is not None:
+        queue.close()
 
-# Step 4: Clear tray and finalize
-clear_download_tray()
-print("Universal OCR automation complete.")
+if __name__ == "__main__":
+    main()